@@ -0,0 +1,385 @@
+"""Gallery quantization benchmark."""
+
+import rootutils
+
+ROOT = rootutils.autosetup()
+
+import argparse
+import time
+from typing import Callable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlmodel import text
+
+from src.db.pg_db import QUANTIZATIONS, PgSyncDb, vector_ops
+from src.engine.fr_gallery import FrGallery, l2_normalize
+from src.schema.configs import cfg
+from src.utils.logger import get_logger
+
+log = get_logger()
+
+# search results: (matched ids, top-1 id) per query
+SearchFn = Callable[[np.ndarray], Tuple[List[Set[int]], List[int]]]
+
+
+def make_embds(
+    identities: int,
+    faces: int,
+    queries: int,
+    dim: int = 512,
+    noise: float = 2.0,
+    seed: int = 0,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Synthetic gallery of `faces` noisy faces per identity, and noisy query
+    faces. Identities are random unit vectors, faces add gaussian noise of
+    norm about `noise`: at 2.0 a face is as close to its own identity as to
+    the nearest of ~100k impostors, as with real embeddings at that scale.
+    Returns gallery (identities * faces, dim), its labels, queries and their
+    labels.
+    """
+    rng = np.random.default_rng(seed)
+    centers = l2_normalize(rng.standard_normal((identities, dim), dtype=np.float32))
+    scale = noise / np.sqrt(dim)
+    gallery = np.repeat(centers, faces, axis=0)
+    gallery += scale * rng.standard_normal(gallery.shape, dtype=np.float32)
+    labels = rng.integers(0, identities, queries)
+    probes = centers[labels] + scale * rng.standard_normal(
+        (queries, dim), dtype=np.float32
+    )
+
+    return gallery, np.repeat(np.arange(identities), faces), probes, labels
+
+
+def load_embds(
+    path: str, queries: int, seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Real embeddings from an `.npz` file of `embeddings` (n, dim) and their
+    identity `labels` (n,), e.g. the engine output over a labelled face
+    dataset. One face of up to `queries` identities with several faces is
+    held out as a query, the others are the gallery.
+    """
+    data = np.load(path)
+    embds = np.asarray(data["embeddings"], dtype=np.float32)
+    labels = np.asarray(data["labels"])
+    rng = np.random.default_rng(seed)
+
+    order = rng.permutation(len(embds))
+    _, first, counts = np.unique(labels[order], return_index=True, return_counts=True)
+    held_out = order[first[counts > 1]]
+    held_out = held_out[:queries]
+    mask = np.ones(len(embds), dtype=bool)
+    mask[held_out] = False
+
+    return embds[mask], labels[mask], embds[held_out], labels[held_out]
+
+
+def hardness(
+    gallery: np.ndarray,
+    gallery_labels: np.ndarray,
+    probes: np.ndarray,
+    labels: np.ndarray,
+) -> Tuple[float, float]:
+    """Mean cosine distance of queries to their closest genuine and impostor face."""
+    gallery = l2_normalize(gallery)
+    genuine, impostor = [], []
+    for start in range(0, len(probes), 256):
+        dists = 1.0 - l2_normalize(probes[start : start + 256]) @ gallery.T
+        same = gallery_labels[None] == labels[start : start + 256, None]
+        genuine.append(np.where(same, dists, np.inf).min(axis=1))
+        impostor.append(np.where(same, np.inf, dists).min(axis=1))
+
+    return float(np.mean(np.concatenate(genuine))), float(
+        np.mean(np.concatenate(impostor))
+    )
+
+
+def run_queries(
+    name: str,
+    search: SearchFn,
+    probes: np.ndarray,
+    labels: np.ndarray,
+    gallery_labels: np.ndarray,
+    exact: Optional[List[Set[int]]],
+    k: int,
+    batch_size: int,
+    memory: int,
+) -> List[Set[int]]:
+    """
+    Log recall@k (against `exact`, or itself), top-1 identification accuracy,
+    latency and memory of a search. Returns the matched ids of every query.
+    """
+    found, top1, latencies = [], [], []
+    for start in range(0, len(probes), batch_size):
+        batch = probes[start : start + batch_size]
+        t0 = time.perf_counter()
+        batch_found, batch_top1 = search(batch)
+        latencies.append((time.perf_counter() - t0) / len(batch))
+        found += batch_found
+        top1 += batch_top1
+
+    exact = found if exact is None else exact
+    recall = np.mean([len(f & e) / k for f, e in zip(found, exact)])
+    accuracy = np.mean(gallery_labels[np.array(top1)] == labels)
+    log.info(
+        f"{name:>16}: recall@{k} {recall:.4f}, top-1 {accuracy:.4f}, "
+        f"latency {1000 * np.mean(latencies):.3f} ms/query, "
+        f"memory {memory / 2**20:.1f} MiB"
+    )
+
+    return found
+
+
+def bench_gallery(
+    gallery: np.ndarray,
+    gallery_labels: np.ndarray,
+    probes: np.ndarray,
+    labels: np.ndarray,
+    k: int = 5,
+    rerank_factor: int = 4,
+    batch_size: int = 32,
+) -> List[Set[int]]:
+    """
+    Recall@k (against the exact search), top-1 identification accuracy,
+    latency and memory of every in-memory gallery quantization. Memory is
+    the embeddings plus the codes: "bit" keeps its float16 embeddings for
+    the re-rank, so it takes the memory of "halfvec" plus 1/16. Returns the
+    exact matches.
+    """
+    ids = np.arange(len(gallery))
+    metas = [(str(i), None, None) for i in ids]
+
+    exact = None
+    for quantization in ["none", "halfvec", "bit"]:
+        fr_gallery = FrGallery(
+            dim=gallery.shape[1], quantization=quantization, rerank_factor=rerank_factor
+        )
+        fr_gallery.load(ids, metas, gallery)
+        size = len(fr_gallery)
+        memory = fr_gallery.embds[:size].nbytes + fr_gallery.codes[:size].nbytes
+
+        def search(batch: np.ndarray) -> Tuple[List[Set[int]], List[int]]:
+            matches = fr_gallery.search(batch.tolist(), distance=2.0, k=k)
+            found = [{match["id"] for match in query} for query in matches]
+
+            return found, [query[0]["id"] for query in matches]
+
+        found = run_queries(
+            f"gallery {quantization}",
+            search,
+            probes,
+            labels,
+            gallery_labels,
+            exact,
+            k,
+            batch_size,
+            memory,
+        )
+        exact = exact or found
+
+    return exact
+
+
+def bench_pg(
+    gallery: np.ndarray,
+    gallery_labels: np.ndarray,
+    probes: np.ndarray,
+    labels: np.ndarray,
+    exact: List[Set[int]],
+    k: int = 5,
+    rerank_factor: int = 4,
+    batch_size: int = 32,
+    ef_search: int = 40,
+) -> None:
+    """
+    Same measures for pgvector, on a `bench_faces` table of the configured
+    database (dropped after), with the configured index type and, for every
+    quantization, the two-stage query of the API: `k * rerank_factor`
+    candidates on the index expression, re-ranked by the exact distance.
+    Memory is the index size.
+    """
+    dim = gallery.shape[1]
+    pg = PgSyncDb(
+        host=cfg.POSTGRES_HOST,
+        port=cfg.POSTGRES_PORT,
+        user=cfg.POSTGRES_USER,
+        password=cfg.POSTGRES_PASSWORD,
+        db=cfg.POSTGRES_DB,
+    )
+    pg.setup()
+    index_type = cfg.POSTGRES_INDEX_TYPE
+    try:
+        with pg.engine.begin() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS bench_faces"))
+            conn.execute(
+                text(
+                    "CREATE TABLE bench_faces "
+                    f"(id BIGINT PRIMARY KEY, embedding vector({dim}))"
+                )
+            )
+        rows = [
+            (i, "[" + ",".join(map(str, embd)) + "]")
+            for i, embd in enumerate(l2_normalize(gallery).tolist())
+        ]
+        for start in range(0, len(rows), 10000):
+            pg.copy_rows(
+                "bench_faces", ["id", "embedding"], rows[start : start + 10000]
+            )
+
+        for quantization in ["none", "halfvec", "bit"]:
+            expression = QUANTIZATIONS[quantization][0]
+            operator, ops = vector_ops(quantization, "ip")
+            if index_type == "hnsw":
+                params = (
+                    f"m = {cfg.POSTGRES_HNSW_M}, "
+                    f"ef_construction = {cfg.POSTGRES_HNSW_EF_CONSTRUCTION}"
+                )
+            else:
+                params = f"lists = {cfg.POSTGRES_IVFFLAT_LISTS}"
+            t0 = time.perf_counter()
+            with pg.engine.begin() as conn:
+                conn.execute(text("DROP INDEX IF EXISTS bench_faces_idx"))
+                memory = 0
+                if index_type != "none":
+                    conn.execute(
+                        text(
+                            f"CREATE INDEX bench_faces_idx ON bench_faces "
+                            f"USING {index_type} "
+                            f"({expression.format(column='embedding', dim=dim)} "
+                            f"{ops}) WITH ({params})"
+                        )
+                    )
+                    memory = conn.execute(
+                        text("SELECT pg_relation_size('bench_faces_idx')")
+                    ).scalar()
+                    log.info(
+                        f"Built {index_type} {quantization} index "
+                        f"in {time.perf_counter() - t0:.1f} s"
+                    )
+
+            order = (
+                f"{expression.format(column='embedding', dim=dim)} {operator} "
+                f"{expression.format(column='CAST(q.embd AS vector)', dim=dim)}"
+            )
+            statement = text(
+                f"""
+                SELECT q.idx, f.id
+                FROM unnest(CAST(:embds AS text[])) WITH ORDINALITY AS q(embd, idx)
+                CROSS JOIN LATERAL (
+                    SELECT c.id, c.embedding <#> CAST(q.embd AS vector) AS distance
+                    FROM (
+                        SELECT id, embedding FROM bench_faces
+                        ORDER BY {order}
+                        LIMIT :candidates
+                    ) AS c
+                    ORDER BY distance
+                    LIMIT :k
+                ) AS f
+                ORDER BY q.idx, f.distance
+                """
+            )
+            rerank = quantization != "none"
+            candidates = k * rerank_factor if rerank else k
+
+            def search(batch: np.ndarray) -> Tuple[List[Set[int]], List[int]]:
+                embds = [
+                    "[" + ",".join(map(str, embd)) + "]"
+                    for embd in l2_normalize(batch).tolist()
+                ]
+                with pg.engine.begin() as conn:
+                    # the hnsw scan returns at most ef_search rows (max 1000)
+                    conn.execute(
+                        text("SELECT set_config('hnsw.ef_search', :ef_search, true)"),
+                        {"ef_search": str(min(max(ef_search, candidates), 1000))},
+                    )
+                    conn.execute(
+                        text("SELECT set_config('ivfflat.probes', :probes, true)"),
+                        {"probes": str(cfg.POSTGRES_IVFFLAT_PROBES)},
+                    )
+                    rows = conn.execute(
+                        statement, {"embds": embds, "k": k, "candidates": candidates}
+                    ).all()
+                found: List[List[int]] = [[] for _ in embds]
+                for idx, face_id in rows:
+                    found[idx - 1].append(face_id)
+
+                return [set(f) for f in found], [f[0] for f in found]
+
+            run_queries(
+                f"pg {index_type} {quantization}",
+                search,
+                probes,
+                labels,
+                gallery_labels,
+                exact,
+                k,
+                batch_size,
+                memory,
+            )
+    finally:
+        with pg.engine.begin() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS bench_faces"))
+        pg.dispose()
+
+
+if __name__ == "__main__":
+    """Gallery quantization benchmark."""
+
+    parser = argparse.ArgumentParser(description="Benchmark gallery quantization")
+    parser.add_argument(
+        "--embeddings",
+        type=str,
+        default=None,
+        help="npz of real `embeddings` and `labels`, instead of synthetic ones",
+    )
+    parser.add_argument("--identities", type=int, default=20000)
+    parser.add_argument("--faces", type=int, default=5, help="faces per identity")
+    parser.add_argument(
+        "--noise", type=float, default=2.0, help="synthetic face noise norm"
+    )
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument(
+        "--pg", action="store_true", help="also run pgvector (configured database)"
+    )
+    parser.add_argument("--ef-search", type=int, default=cfg.POSTGRES_HNSW_EF_SEARCH)
+    args = parser.parse_args()
+
+    if args.embeddings:
+        gallery, gallery_labels, probes, labels = load_embds(
+            args.embeddings, args.queries
+        )
+    else:
+        gallery, gallery_labels, probes, labels = make_embds(
+            args.identities, args.faces, args.queries, noise=args.noise
+        )
+    genuine, impostor = hardness(gallery, gallery_labels, probes, labels)
+    log.info(
+        f"{len(gallery)} faces, {len(probes)} queries, closest genuine distance "
+        f"{genuine:.3f}, closest impostor distance {impostor:.3f}"
+    )
+
+    exact = bench_gallery(
+        gallery,
+        gallery_labels,
+        probes,
+        labels,
+        k=args.k,
+        rerank_factor=args.rerank_factor,
+        batch_size=args.batch_size,
+    )
+    if args.pg:
+        bench_pg(
+            gallery,
+            gallery_labels,
+            probes,
+            labels,
+            exact,
+            k=args.k,
+            rerank_factor=args.rerank_factor,
+            batch_size=args.batch_size,
+            ef_search=args.ef_search,
+        )
@@ -4,14 +4,19 @@ import rootutils
 
 ROOT = rootutils.autosetup()
 
+import tarfile
+import zipfile
 from io import BytesIO
+from pathlib import Path
+from typing import List, Tuple
 
-import numpy as np
-from fastapi import APIRouter, Depends, FastAPI
-from PIL import Image
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request, status
+from fastapi.responses import JSONResponse
 
-from src.db.pg_db import PgSyncDb
+from src.db.pg_db import PgAsyncDb, PgSyncDb
 from src.schema.configs import Configs
+from src.utils.executor import BoundedExecutor, ExecutorBusyError
+from src.utils.image import IMAGE_SUFFIXES
 from src.utils.logger import get_logger
 
 log = get_logger()
@@ -26,41 +31,131 @@ class BaseApi:
         self.app = FastAPI()
         self.router = APIRouter()
 
-        # db
-        self.pg = PgSyncDb(
+        # db, tables are created once with the sync engine
+        self.pg_sync = PgSyncDb(
             host=self.cfg.POSTGRES_HOST,
             port=self.cfg.POSTGRES_PORT,
             user=self.cfg.POSTGRES_USER,
             password=self.cfg.POSTGRES_PASSWORD,
             db=self.cfg.POSTGRES_DB,
+            index_type=self.cfg.POSTGRES_INDEX_TYPE,
+            hnsw_m=self.cfg.POSTGRES_HNSW_M,
+            hnsw_ef_construction=self.cfg.POSTGRES_HNSW_EF_CONSTRUCTION,
+            ivfflat_lists=self.cfg.POSTGRES_IVFFLAT_LISTS,
+            quantization=self.cfg.POSTGRES_INDEX_QUANTIZATION,
+            index_method=self.cfg.POSTGRES_INDEX_METHOD,
         )
-        self.pg.setup()
-        self.pg.create_all()
+        self.pg_sync.setup()
+        self.pg_sync.create_all()
 
-        self.setup()
-
-    def setup(self) -> None:
-        """Setup the API router."""
+        # no connection is carried into forked workers
+        self.pg_sync.dispose()
 
-        # NOTE: async pg not yet supported
-        # @self.router.on_event("startup")
-        # async def startup_event():
-        #     """Startup event."""
-        #     log.log(21, f"Load startup event")
-        #     self.pg.setup()
-        #     self.pg.create_all()
-
-        #     log.log(21, f"Startup event complete")
+        # async db, connection pool is created on startup (per worker)
+        self.pg = PgAsyncDb(
+            host=self.cfg.POSTGRES_HOST,
+            port=self.cfg.POSTGRES_PORT,
+            user=self.cfg.POSTGRES_USER,
+            password=self.cfg.POSTGRES_PASSWORD,
+            db=self.cfg.POSTGRES_DB,
+            pool_size=self.cfg.POSTGRES_POOL_SIZE,
+            max_overflow=self.cfg.POSTGRES_MAX_OVERFLOW,
+            pool_timeout=self.cfg.POSTGRES_POOL_TIMEOUT,
+            pool_recycle=self.cfg.POSTGRES_POOL_RECYCLE,
+            hnsw_ef_search=self.cfg.POSTGRES_HNSW_EF_SEARCH,
+            ivfflat_probes=self.cfg.POSTGRES_IVFFLAT_PROBES,
+        )
 
-        pass
+        # executor, keep blocking engine calls off the event loop
+        self.engine_executor = BoundedExecutor(
+            name="engine",
+            max_workers=self.cfg.FR_ENGINE_WORKERS,
+            max_queue=self.cfg.FR_ENGINE_MAX_QUEUE,
+        )
 
-    async def preprocess_img_bytes(self, img_bytes: bytes) -> np.ndarray:
-        """Preprocess image bytes."""
-        img = Image.open(BytesIO(img_bytes))
-        img = np.array(img)
+        self.setup()
 
-        # if PNG, convert to RGB
-        if img.shape[-1] == 4:
-            img = img[..., :3]
+    def setup(self) -> None:
+        """Setup the API router."""
 
-        return img
+        @self.router.on_event("startup")
+        async def startup_event():
+            """Startup event."""
+            log.log(21, f"Load startup event")
+            await self.pg.setup()
+
+            # the sync pool may have been inherited from the master process
+            self.pg_sync.dispose(close=False)
+
+            log.log(21, f"Startup event complete")
+
+        @self.router.on_event("shutdown")
+        async def shutdown_event():
+            """Shutdown event."""
+            await self.pg.close()
+            self.engine_executor.shutdown()
+
+        @self.router.get("/health")
+        async def health() -> dict:
+            """Health check with db pool utilization."""
+            return {"status": "ok", "db_pool": self.pg.pool_status()}
+
+    def extract_archive(
+        self, archive_bytes: bytes, max_files: int
+    ) -> List[Tuple[str, bytes]]:
+        """
+        Extract (filename, bytes) of every image of a zip or tar archive. The
+        members are counted before anything is extracted: more than
+        `max_files` images is rejected (413), as is a non-archive (400).
+        """
+        files: List[Tuple[str, bytes]] = []
+        try:
+            if zipfile.is_zipfile(BytesIO(archive_bytes)):
+                with zipfile.ZipFile(BytesIO(archive_bytes)) as archive:
+                    members = [
+                        info
+                        for info in archive.infolist()
+                        if not info.is_dir()
+                        and Path(info.filename).suffix.lower() in IMAGE_SUFFIXES
+                    ]
+                    self.check_archive_size(len(members), max_files)
+                    for info in members:
+                        files.append((info.filename, archive.read(info)))
+            else:
+                with tarfile.open(
+                    fileobj=BytesIO(archive_bytes), mode="r:*"
+                ) as archive:
+                    members = [
+                        member
+                        for member in archive.getmembers()
+                        if member.isfile()
+                        and Path(member.name).suffix.lower() in IMAGE_SUFFIXES
+                    ]
+                    self.check_archive_size(len(members), max_files)
+                    for member in members:
+                        files.append((member.name, archive.extractfile(member).read()))
+        except (tarfile.TarError, zipfile.BadZipFile, EOFError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid archive",
+            )
+
+        return sorted(files)
+
+    def check_archive_size(self, count: int, max_files: int) -> None:
+        """Reject an archive of more than `max_files` images."""
+        if count > max_files:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Too many images, max {max_files}",
+            )
+
+
+async def busy_exception_handler(request: Request, exc: ExecutorBusyError):
+    """Reply 429 when an executor or scheduler queue is full."""
+    log.log(21, f"Reject request {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": "Server is busy, please retry later"},
+        headers={"Retry-After": "1"},
+    )
@@ -4,16 +4,52 @@ import rootutils
 
 ROOT = rootutils.autosetup()
 
+import asyncio
+import tarfile
+import zipfile
 from datetime import datetime
-from typing import List, Literal
+from typing import List, Literal, Optional, Tuple
 
-from fastapi import APIRouter, File, HTTPException, UploadFile, status
-from sqlmodel import select
+import numpy as np
+from fastapi import (
+    APIRouter,
+    File,
+    HTTPException,
+    Query,
+    UploadFile,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
+from fastapi.responses import StreamingResponse
+from pgvector.sqlalchemy import Vector
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import delete, func, select, text, update
 
 from src.api.base_api import BaseApi
+from src.db.pg_db import METHODS, QUANTIZATIONS, vector_ops
+from src.engine.batch_scheduler import FrBatchScheduler
+from src.engine.face_tracker import FaceTracker
+from src.engine.fr_cache import FrResultCache, SharedFrResultCache
+from src.engine.fr_enroller import FrBulkEnroller
+from src.engine.fr_gallery import FrGallery, SharedFrGallery
 from src.engine.fr_onnx_engine import FrOnnxEngine
+from src.engine.onnx_engine import tune_session_threads
 from src.schema.configs import Configs
-from src.schema.fr_schema import FacesFrSqlSchema, ReadFacesFrSchema
+from src.schema.fr_schema import (
+    EnrollFrSchema,
+    FaceEmbeddingsFrSqlSchema,
+    FacesFrSqlSchema,
+    FrResultSchema,
+    MatchFacesFrSchema,
+    PageFacesFrSchema,
+    ReadFacesFrSchema,
+    RecognizeBatchFrSchema,
+    StreamFaceFrSchema,
+    StreamFrSchema,
+)
+from src.utils.executor import ExecutorBusyError
+from src.utils.image import EncodedImage
 from src.utils.logger import get_logger
 
 log = get_logger()
@@ -32,29 +68,138 @@ class FrApi(BaseApi):
 
     def setup_engine(self) -> None:
         """Setup the face recognition engine."""
+        det_session, rec_session = self.cfg.FR_DET_SESSION, self.cfg.FR_REC_SESSION
+        lmk_session = self.cfg.FR_LMK_SESSION
+        if self.cfg.FR_SESSION_AUTO_TUNE:
+            workers = self.cfg.API_WORKERS
+            concurrency = self.cfg.FR_ENGINE_WORKERS
+            det_session = tune_session_threads(det_session, workers, concurrency)
+            rec_session = tune_session_threads(rec_session, workers, concurrency)
+            lmk_session = tune_session_threads(lmk_session, workers, concurrency)
+
         self.engine = FrOnnxEngine(
             det_engine_path=self.cfg.FR_DET_ENGINE_PATH,
             rec_engine_path=self.cfg.FR_REC_ENGINE_PATH,
             det_max_end2end=self.cfg.FR_DET_MAX_END2END,
             provider=self.cfg.FR_PROVIDER,
+            io_binding=self.cfg.FR_IO_BINDING,
+            det_session=det_session,
+            rec_session=rec_session,
+            lmk_engine_path=self.cfg.FR_LMK_ENGINE_PATH or None,
+            lmk_session=lmk_session,
         )
         self.engine.setup()
 
+        # coalesce concurrent requests into batched engine calls
+        self.scheduler = FrBatchScheduler(
+            engine=self.engine,
+            executor=self.engine_executor,
+            max_batch_size=self.cfg.FR_BATCH_MAX_SIZE,
+            max_wait_ms=self.cfg.FR_BATCH_MAX_WAIT_MS,
+            max_queue=self.cfg.FR_ENGINE_MAX_QUEUE,
+        )
+
+        # engine result cache, keyed by image content and detection thresholds
+        self.cache: Optional[FrResultCache] = None
+        if self.cfg.FR_CACHE_ENABLED and self.cfg.FR_CACHE_SHARED_PATH:
+            self.cache = SharedFrResultCache(
+                path=self.cfg.FR_CACHE_SHARED_PATH,
+                max_size=self.cfg.FR_CACHE_MAX_SIZE,
+                ttl=self.cfg.FR_CACHE_TTL,
+            )
+        elif self.cfg.FR_CACHE_ENABLED:
+            self.cache = FrResultCache(
+                max_size=self.cfg.FR_CACHE_MAX_SIZE, ttl=self.cfg.FR_CACHE_TTL
+            )
+
+        # bulk enrollment, in its own threads
+        self.enroller = FrBulkEnroller(
+            engine=self.engine,
+            pg=self.pg_sync,
+            batch_size=self.cfg.FR_ENROLL_BATCH_SIZE,
+            workers=self.cfg.FR_ENROLL_WORKERS,
+            commit_size=self.cfg.FR_ENROLL_COMMIT_SIZE,
+            det_side=(
+                max(self.engine.det_engine.img_shape)
+                if self.cfg.FR_REDUCED_DECODE
+                else None
+            ),
+        )
+
+        # in-memory gallery, loaded from the database on startup
+        self.gallery: Optional[FrGallery] = None
+        if self.cfg.FR_GALLERY_ENABLED and self.cfg.FR_GALLERY_SHARED_DIR:
+            self.gallery = SharedFrGallery(
+                path=self.cfg.FR_GALLERY_SHARED_DIR,
+                flush_interval=self.cfg.FR_GALLERY_FLUSH_INTERVAL,
+                quantization=self.cfg.FR_GALLERY_QUANTIZATION,
+                rerank_factor=self.cfg.FR_GALLERY_RERANK_FACTOR,
+                search_samples=self.cfg.FR_SEARCH_SAMPLES,
+            )
+        elif self.cfg.FR_GALLERY_ENABLED:
+            self.gallery = FrGallery(
+                quantization=self.cfg.FR_GALLERY_QUANTIZATION,
+                rerank_factor=self.cfg.FR_GALLERY_RERANK_FACTOR,
+                search_samples=self.cfg.FR_SEARCH_SAMPLES,
+            )
+
     def setup(self) -> None:
         """Setup the face recognition API router."""
+        super().setup()
+
+        @self.router.on_event("startup")
+        async def gallery_startup_event():
+            """Load the gallery and schedule its periodic resync."""
+            if self.gallery is None:
+                return
+            await self.sync_gallery()
+            self.gallery_task = asyncio.create_task(self.sync_gallery_loop())
+
+        @self.router.on_event("shutdown")
+        async def scheduler_shutdown_event():
+            """Stop the batch scheduler worker."""
+            await self.scheduler.stop()
 
         @self.router.get(
             "/face",
-            response_model=List[ReadFacesFrSchema],
+            response_model=PageFacesFrSchema,
         )
-        async def list_faces() -> List[ReadFacesFrSchema]:
-            """List all faces."""
-            log.log(21, f"Request to list all faces")
-            faces = self.pg.session.exec(select(FacesFrSqlSchema)).all()
+        async def list_faces(
+            limit: int = Query(100, ge=1, le=1000),
+            cursor: Optional[int] = None,
+            prefix: Optional[str] = None,
+        ) -> PageFacesFrSchema:
+            """
+            List faces by id, `limit` per page. Pass the returned `next_cursor`
+            as `cursor` to get the next page. Optionally filter by name prefix.
+            """
+            log.log(21, f"Request to list faces (cursor: {cursor}, prefix: {prefix})")
+            faces = await self.db_list_faces(limit + 1, cursor, prefix)
+
+            # one extra row tells whether there is a next page
+            next_cursor = faces[limit - 1].id if len(faces) > limit else None
+            faces = faces[:limit]
 
             log.log(21, f"Founds {len(faces)} faces")
 
-            return [ReadFacesFrSchema(**face.model_dump(), box=None) for face in faces]
+            return PageFacesFrSchema(faces=faces, next_cursor=next_cursor)
+
+        @self.router.get("/face/export")
+        async def export_faces(prefix: Optional[str] = None) -> StreamingResponse:
+            """Export all faces (without embeddings) as a streamed JSON array."""
+            log.log(21, f"Request to export faces (prefix: {prefix})")
+
+            return StreamingResponse(
+                self.stream_faces_json(prefix), media_type="application/json"
+            )
+
+        @self.router.get("/face/cache")
+        async def cache_stats() -> dict:
+            """Engine result cache size and hit/miss counters."""
+            if self.cache is None:
+                return {"enabled": False}
+
+            return {"enabled": True, **(await self.cache.astats())}
 
         @self.router.post(
             "/face/register",
@@ -63,28 +208,25 @@ class FrApi(BaseApi):
         async def register_face(
             name: str,
             image: UploadFile = File(...),
+            reenroll: bool = False,
             detConf: float = 0.25,
             detNms: float = 0.45,
         ) -> ReadFacesFrSchema:
-            """Register a face."""
+            """
+            Register a face (identity) with its first sample. With `reenroll`,
+            replace all the samples of a name.
+            """
             log.log(21, f"Request to register a face with name: {name}")
 
             # check if name already exists
-            faces_db = self.pg.session.exec(select(FacesFrSqlSchema)).all()
-            for face_db in faces_db:
-                if face_db.name == name:
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail="Name already exists",
-                    )
-
-            # bytes to numpy
-            img_np = await self.preprocess_img_bytes(await image.read())
+            if not reenroll and await self.db_name_exists(name):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Name already exists",
+                )
 
             # recognize faces
-            faces = self.engine.predict([img_np], det_conf=detConf, det_nms=detNms)
-            # single batch
-            faces = faces[0]
+            faces = await self.predict_faces(await image.read(), detConf, detNms)
 
             # check if face detected
             if len(faces.boxes) == 0:
@@ -100,43 +242,145 @@ class FrApi(BaseApi):
                     detail="Only one face allowed",
                 )
 
-            # only iterate once
-            for embd in faces.embeddings:
-                face = FacesFrSqlSchema(
-                    name=name,
-                    embedding=embd,
-                    created_at=datetime.now(),
-                    updated_at=datetime.now(),
+            face = await self.db_upsert_face(name, faces.embeddings[0], reenroll)
+            if face is None:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Name already exists",
+                )
+            if self.gallery is not None:
+                await self.engine_executor.run_unbounded(
+                    self.gallery.add,
+                    face.id,
+                    face.name,
+                    face.embedding,
+                    face.created_at,
+                    face.updated_at,
+                    samples=(
+                        np.asarray(faces.embeddings[:1])
+                        if self.cfg.FR_SEARCH_SAMPLES
+                        else None
+                    ),
                 )
-                self.pg.session.add(face)
-                self.pg.session.commit()
-                self.pg.session.refresh(face)
 
             log.log(21, f"Face registered with id: {face.id}")
 
             return ReadFacesFrSchema(**face.model_dump(), box=faces.boxes[0])
 
+        @self.router.post(
+            "/face/{id}/samples",
+            response_model=ReadFacesFrSchema,
+        )
+        async def add_face_sample(
+            id: int,
+            image: UploadFile = File(...),
+            detConf: float = 0.25,
+            detNms: float = 0.45,
+        ) -> ReadFacesFrSchema:
+            """Add a sample (another photo) to a face, updating its centroid."""
+            log.log(21, f"Request to add a sample to face with id: {id}")
+
+            # recognize faces
+            faces = await self.predict_faces(await image.read(), detConf, detNms)
+
+            # check if face detected
+            if len(faces.boxes) == 0:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="No face detected",
+                )
+
+            # only allow one face
+            if len(faces.boxes) > 1:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Only one face allowed",
+                )
+
+            face = await self.db_add_face_sample(id, faces.embeddings[0])
+            if face is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Face not found",
+                )
+            if self.gallery is not None:
+                await self.engine_executor.run_unbounded(
+                    self.gallery.add,
+                    face.id,
+                    face.name,
+                    face.embedding,
+                    face.created_at,
+                    face.updated_at,
+                    samples=(
+                        await self.db_face_samples(face.id)
+                        if self.cfg.FR_SEARCH_SAMPLES
+                        else None
+                    ),
+                )
+
+            log.log(21, f"Sample added to face with id: {face.id}")
+
+            return ReadFacesFrSchema(**face.model_dump(), box=faces.boxes[0])
+
+        @self.router.post(
+            "/face/enroll",
+            response_model=EnrollFrSchema,
+        )
+        async def enroll_faces(
+            archive: UploadFile = File(...),
+            detConf: float = 0.25,
+            detNms: float = 0.45,
+        ) -> EnrollFrSchema:
+            """
+            Bulk enroll a zip/tar archive of single-face images, named after the
+            image file names. Rejected images are reported.
+            """
+            log.log(21, f"Request to bulk enroll faces: {archive.filename}")
+
+            try:
+                result = await asyncio.to_thread(
+                    self.enroller.enroll, archive.file, detConf, detNms
+                )
+            except (tarfile.TarError, zipfile.BadZipFile, EOFError):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Invalid archive",
+                )
+            if result.enrolled:
+                # ivfflat indexes are deferred until the faces are loaded
+                await asyncio.to_thread(self.pg_sync.create_vector_indexes)
+            if self.gallery is not None and result.enrolled:
+                await self.sync_gallery(force=True)
+
+            log.log(
+                21,
+                f"Enrolled {result.enrolled} faces, rejected {len(result.rejected)}",
+            )
+
+            return result
+
         @self.router.post(
             "/face/recognize",
             response_model=List[ReadFacesFrSchema],
         )
         async def recognize_faces(
             image: UploadFile = File(...),
-            method: Literal["cosine"] = "cosine",
+            method: Literal["cosine", "ip", "l2"] = "ip",
             distance: float = 0.5,
+            topK: int = Query(1, ge=1, le=100),
             detConf: float = 0.25,
             detNms: float = 0.45,
         ) -> List[ReadFacesFrSchema]:
-            """Recognize faces."""
+            """
+            Recognize faces. Each face gets its closest match, `topK` ranked.
+            With `method` "cosine" or "ip" (same distance, embeddings are
+            normalized) the distance is 1 - cosine similarity, with "l2" the
+            euclidean distance (sqrt(2 * cosine distance)).
+            """
             log.log(21, f"Request to recognize faces")
 
-            # bytes to numpy
-            img_np = await self.preprocess_img_bytes(await image.read())
-
             # recognize faces
-            faces = self.engine.predict([img_np], det_conf=detConf, det_nms=detNms)
-            # single batch
-            faces = faces[0]
+            faces = await self.predict_faces(await image.read(), detConf, detNms)
 
             # check if face detected
             if len(faces.boxes) == 0:
@@ -146,30 +390,196 @@ class FrApi(BaseApi):
                 )
 
             # query similar faces
-            results: List[ReadFacesFrSchema] = []
-            for box, embd in zip(faces.boxes, faces.embeddings):
-                # TODO: add more methods
-                if method == "cosine":
-                    responses = self.pg.session.exec(
-                        select(FacesFrSqlSchema)
-                        .filter(
-                            FacesFrSqlSchema.embedding.cosine_distance(embd) < distance
-                        )
-                        .limit(1)
-                    ).all()
-                else:
+            responses = await self.search_faces(
+                faces.embeddings, distance, topK, method
+            )
+
+            return self.build_results(faces.boxes, responses, topK)
+
+        @self.router.post(
+            "/face/recognize/batch",
+            response_model=List[RecognizeBatchFrSchema],
+        )
+        async def recognize_faces_batch(
+            images: List[UploadFile] = File(None),
+            archive: UploadFile = File(None),
+            method: Literal["cosine", "ip", "l2"] = "ip",
+            distance: float = 0.5,
+            topK: int = Query(1, ge=1, le=100),
+            detConf: float = 0.25,
+            detNms: float = 0.45,
+        ) -> List[RecognizeBatchFrSchema]:
+            """
+            Recognize faces of many images (multipart list and/or a zip/tar
+            archive) with batched engine calls and one gallery query.
+            """
+            log.log(21, f"Request to recognize faces in batch")
+
+            files = [(image.filename, await image.read()) for image in images or []]
+            if archive is not None:
+                files += await self.engine_executor.run(
+                    self.extract_archive,
+                    await archive.read(),
+                    max(self.cfg.FR_BATCH_MAX_IMAGES - len(files), 0),
+                )
+            if not files:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="No image provided",
+                )
+            if len(files) > self.cfg.FR_BATCH_MAX_IMAGES:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"Too many images, max {self.cfg.FR_BATCH_MAX_IMAGES}",
+                )
+
+            # bytes to numpy
+            imgs = []
+            for filename, img_bytes in files:
+                try:
+                    imgs.append(await self.load_img_bytes(img_bytes))
+                except (OSError, ValueError):
                     raise HTTPException(
                         status_code=status.HTTP_400_BAD_REQUEST,
-                        detail="Method not supported",
+                        detail=f"Invalid image: {filename}",
                     )
-                response = responses[0] if responses else None
-                if response:
-                    results.append(ReadFacesFrSchema(**response.model_dump(), box=box))
-                else:
-                    results.append(ReadFacesFrSchema(box=box))
+
+            # recognize faces, in engine calls of at most FR_BATCH_MAX_SIZE images
+            batch_faces: List[FrResultSchema] = []
+            for start in range(0, len(imgs), self.cfg.FR_BATCH_MAX_SIZE):
+                batch_faces += await self.engine_executor.run(
+                    self.engine.predict,
+                    imgs[start : start + self.cfg.FR_BATCH_MAX_SIZE],
+                    detConf,
+                    detNms,
+                )
+
+            # query similar faces of all images at once
+            embds = [embd for faces in batch_faces for embd in faces.embeddings]
+            responses = await self.search_faces(embds, distance, topK, method)
+
+            results: List[RecognizeBatchFrSchema] = []
+            start = 0
+            for (filename, _), faces in zip(files, batch_faces):
+                end = start + len(faces.boxes)
+                results.append(
+                    RecognizeBatchFrSchema(
+                        filename=filename,
+                        faces=self.build_results(
+                            faces.boxes, responses[start:end], topK
+                        ),
+                    )
+                )
+                start = end
+
+            log.log(21, f"Recognized {len(embds)} faces in {len(files)} images")
 
             return results
 
+        @self.router.websocket("/face/stream")
+        async def stream_faces(
+            websocket: WebSocket,
+            method: Literal["cosine", "ip", "l2"] = "ip",
+            distance: float = 0.5,
+            topK: int = Query(1, ge=1, le=100),
+            detConf: float = 0.25,
+            detNms: float = 0.45,
+            every: int = Query(1, ge=1),
+            track: bool = True,
+        ):
+            """
+            Recognize faces in a stream of encoded frames (binary messages).
+            Every `every`-th frame is processed; when the engine falls behind,
+            only the newest pending frame is kept and older ones are dropped.
+            With `track`, faces are tracked across frames and only new, moved
+            or stale tracks are re-embedded. Results are pushed back as JSON
+            text messages.
+            """
+            await websocket.accept()
+            log.log(21, f"Stream connected: {websocket.client}")
+
+            # per-stream state, a single pending frame slot
+            pending = {"frame": None, "data": None, "dropped": 0}
+            ready = asyncio.Event()
+            tracker = (
+                FaceTracker(
+                    match_iou=self.cfg.FR_TRACKER_MATCH_IOU,
+                    reembed_iou=self.cfg.FR_TRACKER_REEMBED_IOU,
+                    max_age=self.cfg.FR_TRACKER_MAX_AGE,
+                    max_misses=self.cfg.FR_TRACKER_MAX_MISSES,
+                )
+                if track
+                else None
+            )
+
+            async def process_frames() -> None:
+                while True:
+                    await ready.wait()
+                    ready.clear()
+                    frame, data = pending["frame"], pending["data"]
+                    dropped, pending["dropped"] = pending["dropped"], 0
+                    pending["data"] = None
+
+                    result = StreamFrSchema(frame=frame, dropped=dropped)
+                    try:
+                        img = await self.load_img_bytes(data)
+                        if tracker is None:
+                            faces = await self.scheduler.predict(
+                                img, det_conf=detConf, det_nms=detNms
+                            )
+                            responses = await self.search_faces(
+                                faces.embeddings, distance, topK, method
+                            )
+                            result.embedded = len(faces.boxes)
+                            result.faces = [
+                                StreamFaceFrSchema(**face.model_dump())
+                                for face in self.build_results(
+                                    faces.boxes, responses, topK
+                                )
+                            ]
+                        else:
+                            result.embedded, result.faces = await self.track_faces(
+                                tracker, img, distance, topK, detConf, detNms, method
+                            )
+                    except ExecutorBusyError:
+                        result.error = "busy"
+                    except (OSError, ValueError):
+                        result.error = "invalid frame"
+                    except Exception as e:
+                        # keep the stream alive, e.g. on a db or engine error
+                        log.error(f"Stream frame {frame} failed: {e!r}")
+                        result.error = "internal error"
+                    await websocket.send_text(result.model_dump_json())
+
+            worker = asyncio.create_task(process_frames())
+            frame = 0
+            try:
+                while True:
+                    message = await websocket.receive()
+                    if message["type"] == "websocket.disconnect":
+                        raise WebSocketDisconnect(message.get("code", 1000))
+                    if worker.done():
+                        break
+                    frame += 1
+                    data = message.get("bytes")
+                    if data is None:
+                        # text frames are answered, not processed
+                        error = StreamFrSchema(frame=frame, error="binary frames only")
+                        await websocket.send_text(error.model_dump_json())
+                        continue
+                    if (frame - 1) % every != 0:
+                        continue
+                    if pending["data"] is not None:
+                        pending["dropped"] += 1
+                    pending["frame"], pending["data"] = frame, data
+                    ready.set()
+            except WebSocketDisconnect:
+                log.log(21, f"Stream disconnected: {websocket.client}")
+            finally:
+                if worker.done() and worker.exception() is not None:
+                    log.error(f"Stream worker failed: {worker.exception()!r}")
+                worker.cancel()
+
         @self.router.delete(
             "/face/{id}",
             status_code=status.HTTP_204_NO_CONTENT,
@@ -178,18 +588,445 @@ class FrApi(BaseApi):
             """Delete a face."""
             log.log(21, f"Request to delete face with id: {id}")
 
-            face = self.pg.session.exec(
-                select(FacesFrSqlSchema).filter(FacesFrSqlSchema.id == id)
-            ).first()
-
-            if not face:
+            if not await self.db_delete_face(id):
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="Face not found",
                 )
-
-            self.pg.session.delete(face)
-            self.pg.session.commit()
+            if self.gallery is not None:
+                await self.engine_executor.run_unbounded(self.gallery.remove, id)
 
             log.log(21, f"Face deleted with id: {id}")
 
+    async def load_img_bytes(self, img_bytes: bytes) -> EncodedImage:
+        """Decode image bytes, at detector resolution when reduced decode is on."""
+        det_side = (
+            max(self.engine.det_engine.img_shape)
+            if self.cfg.FR_REDUCED_DECODE
+            else None
+        )
+
+        return await self.engine_executor.run(EncodedImage, img_bytes, det_side)
+
+    async def predict_faces(
+        self, img_bytes: bytes, det_conf: float, det_nms: float
+    ) -> FrResultSchema:
+        """Detect and embed faces of an encoded image, through the cache."""
+        if self.cache is None:
+            img = await self.load_img_bytes(img_bytes)
+            return await self.scheduler.predict(img, det_conf=det_conf, det_nms=det_nms)
+
+        key = self.cache.key(img_bytes, det_conf, det_nms)
+        faces = await self.cache.aget(key)
+        if faces is None:
+            img = await self.load_img_bytes(img_bytes)
+            faces = await self.scheduler.predict(
+                img, det_conf=det_conf, det_nms=det_nms
+            )
+            await self.cache.aput(key, faces)
+
+        return faces
+
+    async def track_faces(
+        self,
+        tracker: FaceTracker,
+        img: EncodedImage,
+        distance: float,
+        k: int,
+        det_conf: float,
+        det_nms: float,
+        method: Literal["cosine", "ip", "l2"] = "ip",
+    ) -> Tuple[int, List[StreamFaceFrSchema]]:
+        """
+        Detect and track faces of a frame, embedding and querying only the
+        tracks that need it. Returns the number of embedded faces and results.
+        """
+        dets = await self.engine_executor.run(
+            self.engine.detect_faces, [img], det_conf, det_nms
+        )
+        tracks = tracker.update(dets[0].boxes)
+
+        # re-embed new, moved or stale tracks only
+        stale = [i for i, track in enumerate(tracks) if tracker.needs_embedding(track)]
+        if stale:
+            boxes = [dets[0].boxes[i] for i in stale]
+            embds = await self.engine_executor.run(self.engine.embed_faces, img, boxes)
+            responses = await self.search_faces(embds, distance, k, method)
+            for i, response in zip(stale, responses):
+                tracks[i].set_match(response)
+
+        results = [
+            StreamFaceFrSchema(**face.model_dump(), track_id=track.track_id)
+            for face, track in zip(
+                self.build_results(dets[0].boxes, [track.match for track in tracks], k),
+                tracks,
+            )
+        ]
+
+        return len(stale), results
+
+    def build_results(
+        self, boxes: List[List[int]], responses: List[List[dict]], k: int = 1
+    ) -> List[ReadFacesFrSchema]:
+        """Build the response of every face from its box and ranked matches."""
+        results: List[ReadFacesFrSchema] = []
+        for box, response in zip(boxes, responses):
+            if response:
+                results.append(
+                    ReadFacesFrSchema(
+                        **response[0],
+                        box=box,
+                        matches=(
+                            [MatchFacesFrSchema(**r) for r in response]
+                            if k > 1
+                            else None
+                        ),
+                    )
+                )
+            else:
+                results.append(ReadFacesFrSchema(box=box))
+
+        return results
+
+    async def search_faces(
+        self,
+        embds: List[List[float]],
+        distance: float,
+        k: int = 1,
+        method: Literal["cosine", "ip", "l2"] = "ip",
+    ) -> List[List[dict]]:
+        """Search nearest faces in the in-memory gallery, or in the database."""
+        if self.gallery is not None:
+            return await self.engine_executor.run(
+                self.gallery.search, embds, distance, k, method
+            )
+
+        return await self.db_query_faces(embds, distance, k, method)
+
+    async def sync_gallery(self, force: bool = False) -> None:
+        """Refresh the gallery and reload it from the database once stale."""
+        await self.engine_executor.run(self.gallery.refresh)
+        if not force and not self.gallery.is_stale(self.cfg.FR_GALLERY_SYNC_INTERVAL):
+            return
+
+        # changes made while the snapshot is read are kept (shared: locked),
+        # and a single worker reloads, the others map its generation
+        max_age = None if force else self.cfg.FR_GALLERY_SYNC_INTERVAL
+        if not await asyncio.to_thread(self.gallery.begin_sync, max_age):
+            return
+        try:
+            ids, metas, embds = [], [], []
+            async with self.pg.session() as session:
+                rows = await session.stream(
+                    select(
+                        FacesFrSqlSchema.id,
+                        FacesFrSqlSchema.name,
+                        FacesFrSqlSchema.created_at,
+                        FacesFrSqlSchema.updated_at,
+                        FacesFrSqlSchema.embedding,
+                    ).execution_options(yield_per=10000)
+                )
+                async for face_id, name, created_at, updated_at, embd in rows:
+                    ids.append(face_id)
+                    metas.append((name, created_at, updated_at))
+                    embds.append(embd)
+
+            samples = (
+                await self.db_all_face_samples(ids)
+                if self.cfg.FR_SEARCH_SAMPLES
+                else None
+            )
+
+            await self.engine_executor.run(
+                self.gallery.load,
+                ids,
+                metas,
+                np.asarray(embds, dtype=np.float32),
+                samples,
+            )
+        finally:
+            self.gallery.end_sync()
+
+    async def db_all_face_samples(self, ids: List[int]) -> List[np.ndarray]:
+        """Sample embeddings of every face of `ids`, streamed by face id."""
+        samples = {face_id: [] for face_id in ids}
+        async with self.pg.session() as session:
+            rows = await session.stream(
+                select(
+                    FaceEmbeddingsFrSqlSchema.face_id,
+                    FaceEmbeddingsFrSqlSchema.embedding,
+                ).execution_options(yield_per=10000)
+            )
+            async for face_id, embd in rows:
+                if face_id in samples:
+                    samples[face_id].append(embd)
+
+        return [np.asarray(samples[face_id], dtype=np.float32) for face_id in ids]
+
+    async def sync_gallery_loop(self) -> None:
+        """Resync the gallery periodically (registrations from other workers)."""
+        while True:
+            await asyncio.sleep(self.cfg.FR_GALLERY_REFRESH_INTERVAL)
+            try:
+                await self.sync_gallery()
+            except Exception as e:
+                log.error(f"Gallery sync failed: {e}")
+
+    def select_faces(self, prefix: Optional[str] = None):
+        """Select faces columns (no embedding) by id, optionally by name prefix."""
+        statement = select(
+            FacesFrSqlSchema.id,
+            FacesFrSqlSchema.name,
+            FacesFrSqlSchema.created_at,
+            FacesFrSqlSchema.updated_at,
+        ).order_by(FacesFrSqlSchema.id)
+        if prefix:
+            # escape LIKE wildcards, prefix match uses the text_pattern_ops index
+            pattern = (
+                prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            )
+            statement = statement.where(FacesFrSqlSchema.name.like(pattern + "%"))
+
+        return statement
+
+    async def db_list_faces(
+        self, limit: int, cursor: Optional[int] = None, prefix: Optional[str] = None
+    ) -> List[ReadFacesFrSchema]:
+        """List a page of faces from the database, after the `cursor` id."""
+        statement = self.select_faces(prefix)
+        if cursor is not None:
+            statement = statement.where(FacesFrSqlSchema.id > cursor)
+        async with self.pg.session() as session:
+            rows = (await session.exec(statement.limit(limit))).mappings().all()
+
+        return [ReadFacesFrSchema(**row) for row in rows]
+
+    async def stream_faces_json(self, prefix: Optional[str] = None):
+        """Stream all faces from the database as JSON array chunks."""
+        statement = self.select_faces(prefix).execution_options(yield_per=1000)
+        yield "["
+        first = True
+        async with self.pg.session() as session:
+            rows = await session.stream(statement)
+            async for partition in rows.mappings().partitions():
+                chunk = ",".join(
+                    ReadFacesFrSchema(**row).model_dump_json() for row in partition
+                )
+                yield chunk if first else "," + chunk
+                first = False
+        yield "]"
+
+    async def db_name_exists(self, name: str) -> bool:
+        """Check if a face name is already registered."""
+        async with self.pg.session() as session:
+            statement = select(FacesFrSqlSchema.id).where(FacesFrSqlSchema.name == name)
+
+            return (await session.exec(statement.limit(1))).first() is not None
+
+    async def db_upsert_face(
+        self, name: str, embd: List[float], reenroll: bool = False
+    ) -> Optional[FacesFrSqlSchema]:
+        """
+        Insert a face into the database with its first sample. On a name
+        conflict, replace its embedding and samples if `reenroll`, else return
+        None.
+        """
+        now = datetime.now()
+        statement = insert(FacesFrSqlSchema).values(
+            name=name, embedding=embd, created_at=now, updated_at=now
+        )
+        if reenroll:
+            statement = statement.on_conflict_do_update(
+                index_elements=[FacesFrSqlSchema.name],
+                set_={
+                    "embedding": statement.excluded.embedding,
+                    "updated_at": statement.excluded.updated_at,
+                },
+            )
+        else:
+            statement = statement.on_conflict_do_nothing(
+                index_elements=[FacesFrSqlSchema.name]
+            )
+        statement = statement.returning(*FacesFrSqlSchema.__table__.columns)
+
+        async with self.pg.session() as session:
+            row = (await session.exec(statement)).mappings().first()
+            if row is None:
+                return None
+            if reenroll:
+                await session.exec(
+                    delete(FaceEmbeddingsFrSqlSchema).where(
+                        FaceEmbeddingsFrSqlSchema.face_id == row["id"]
+                    )
+                )
+            await session.exec(
+                insert(FaceEmbeddingsFrSqlSchema).values(
+                    face_id=row["id"], embedding=embd, created_at=now
+                )
+            )
+            await session.commit()
+
+        return FacesFrSqlSchema(**row)
+
+    async def db_add_face_sample(
+        self, id: int, embd: List[float]
+    ) -> Optional[FacesFrSqlSchema]:
+        """
+        Add a sample to a face and update its centroid (normalized mean of the
+        normalized samples) in one transaction. Return None if not found.
+        """
+        now = datetime.now()
+        centroid = (
+            select(
+                func.l2_normalize(
+                    func.avg(func.l2_normalize(FaceEmbeddingsFrSqlSchema.embedding)),
+                    type_=Vector(512),
+                )
+            )
+            .where(FaceEmbeddingsFrSqlSchema.face_id == id)
+            .scalar_subquery()
+        )
+        async with self.pg.session() as session:
+            # lock the face, concurrent samples update the centroid in turn
+            statement = select(FacesFrSqlSchema.id).where(FacesFrSqlSchema.id == id)
+            if (await session.exec(statement.with_for_update())).first() is None:
+                return None
+
+            await session.exec(
+                insert(FaceEmbeddingsFrSqlSchema).values(
+                    face_id=id, embedding=embd, created_at=now
+                )
+            )
+            statement = (
+                update(FacesFrSqlSchema)
+                .where(FacesFrSqlSchema.id == id)
+                .values(embedding=centroid, updated_at=now)
+                .returning(*FacesFrSqlSchema.__table__.columns)
+            )
+            row = (await session.exec(statement)).mappings().first()
+            await session.commit()
+
+        return FacesFrSqlSchema(**row)
+
+    async def db_face_samples(self, id: int) -> np.ndarray:
+        """Sample embeddings (n, 512) of a face."""
+        statement = select(FaceEmbeddingsFrSqlSchema.embedding).where(
+            FaceEmbeddingsFrSqlSchema.face_id == id
+        )
+        async with self.pg.session() as session:
+            embds = (await session.exec(statement)).all()
+
+        return np.asarray(embds, dtype=np.float32).reshape(-1, 512)
+
+    async def db_query_faces(
+        self,
+        embds: List[List[float]],
+        distance: float,
+        k: int = 1,
+        method: Literal["cosine", "ip", "l2"] = "ip",
+    ) -> List[List[dict]]:
+        """
+        Query the `k` nearest faces of every embedding in a single round-trip.
+        Returns one list of matches per embedding, closest first, keeping only
+        matches under `distance`.
+
+        `method` picks the operator: "cosine" (`<=>`), "ip" (`<#>`, reported as
+        1 - inner product, the cosine distance of normalized embeddings) or
+        "l2" (`<->`). The ANN index serves the `POSTGRES_INDEX_METHOD` only.
+
+        Faces are first selected by their centroid. With a quantized index or
+        `FR_SEARCH_SAMPLES`, `k * POSTGRES_RERANK_FACTOR` candidates are
+        selected (on the index expression, so with an index scan), then
+        re-ranked by the exact distance to their centroid, or to their closest
+        sample.
+        """
+        quantization = self.cfg.POSTGRES_INDEX_QUANTIZATION
+        expression = QUANTIZATIONS[quantization][0]
+        operator, _ = vector_ops(quantization, method)
+        order = (
+            f"{expression.format(column='faces.embedding', dim=512)} {operator} "
+            f"{expression.format(column='CAST(q.embd AS vector)', dim=512)}"
+        )
+
+        # exact distance on the float embeddings
+        exact = "{column} " + METHODS[method][0] + " CAST(q.embd AS vector)"
+        if method == "ip":
+            exact = f"1 + ({exact})"
+        centroid = exact.format(column="c.embedding")
+        if self.cfg.FR_SEARCH_SAMPLES:
+            # closest sample, the centroid for faces without samples
+            sample = exact.format(column="face_embeddings.embedding")
+            exact = (
+                f"COALESCE((SELECT MIN({sample}) FROM face_embeddings "
+                f"WHERE face_embeddings.face_id = c.id), {centroid})"
+            )
+        else:
+            exact = centroid
+        statement = text(
+            f"""
+            SELECT q.idx, f.id, f.name, f.created_at, f.updated_at, f.distance
+            FROM unnest(CAST(:embds AS text[])) WITH ORDINALITY AS q(embd, idx)
+            CROSS JOIN LATERAL (
+                SELECT
+                    c.id,
+                    c.name,
+                    c.created_at,
+                    c.updated_at,
+                    {exact} AS distance
+                FROM (
+                    SELECT
+                        faces.id,
+                        faces.name,
+                        faces.created_at,
+                        faces.updated_at,
+                        faces.embedding
+                    FROM faces
+                    ORDER BY {order}
+                    LIMIT :candidates
+                ) AS c
+                ORDER BY distance
+                LIMIT :k
+            ) AS f
+            WHERE f.distance < :distance
+            ORDER BY q.idx, f.distance
+            """
+        )
+        rerank = quantization != "none" or self.cfg.FR_SEARCH_SAMPLES
+        params = {
+            "embds": ["[" + ",".join(map(str, embd)) + "]" for embd in embds],
+            "distance": distance,
+            "k": k,
+            "candidates": k * self.cfg.POSTGRES_RERANK_FACTOR if rerank else k,
+        }
+        async with self.pg.session() as session:
+            if self.cfg.POSTGRES_INDEX_TYPE == "hnsw":
+                # the hnsw scan returns at most ef_search rows (max 1000)
+                ef_search = max(self.cfg.POSTGRES_HNSW_EF_SEARCH, params["candidates"])
+                await session.exec(
+                    text("SELECT set_config('hnsw.ef_search', :ef_search, true)"),
+                    params={"ef_search": str(min(ef_search, 1000))},
+                )
+            rows = (await session.exec(statement, params=params)).mappings().all()
+
+        # map back to query order (ordinality is 1-based)
+        results: List[List[dict]] = [[] for _ in embds]
+        for row in rows:
+            results[row["idx"] - 1].append(dict(row))
+
+        return results
+
+    async def db_delete_face(self, id: int) -> bool:
+        """Delete a face from the database. Return False if not found."""
+        async with self.pg.session() as session:
+            face = (
+                await session.exec(
+                    select(FacesFrSqlSchema).filter(FacesFrSqlSchema.id == id)
+                )
+            ).first()
+            if not face:
+                return False
+
+            await session.delete(face)
+            await session.commit()
+
+            return True
@@ -0,0 +1,34 @@
+"""Postgresql data migrations."""
+
+import rootutils
+
+ROOT = rootutils.autosetup()
+
+from typing import List, Tuple
+
+# (name, statements), applied once and in order after the tables are created
+MIGRATIONS: List[Tuple[str, List[str]]] = [
+    (
+        # faces registered before identities had samples: their embedding
+        # becomes their first sample
+        "0001_face_embeddings",
+        [
+            """
+            INSERT INTO face_embeddings (face_id, embedding, created_at)
+            SELECT faces.id, faces.embedding, faces.created_at
+            FROM faces
+            WHERE NOT EXISTS (
+                SELECT 1 FROM face_embeddings WHERE face_embeddings.face_id = faces.id
+            )
+            """,
+        ],
+    ),
+    (
+        # embeddings are normalized by the engine, searched by inner product
+        "0002_normalize_embeddings",
+        [
+            "UPDATE faces SET embedding = l2_normalize(embedding)",
+            "UPDATE face_embeddings SET embedding = l2_normalize(embedding)",
+        ],
+    ),
+]
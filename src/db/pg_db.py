@@ -4,24 +4,89 @@ import rootutils
 
 ROOT = rootutils.autosetup()
 
+import csv
+from contextlib import asynccontextmanager, contextmanager
+from io import StringIO
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
 from pgvector.psycopg2 import register_vector
+from pgvector.sqlalchemy import Vector
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import Session, SQLModel, create_engine, text
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from src.db.migrations import MIGRATIONS
+from src.utils.executor import ExecutorBusyError
 from src.utils.logger import get_logger
 
 log = get_logger()
 
+# (distance operator, operator class suffix) of a search method
+METHODS = {
+    "cosine": ("<=>", "cosine_ops"),
+    "ip": ("<#>", "ip_ops"),
+    "l2": ("<->", "l2_ops"),
+}
+
+# (expression, operator class prefix) of a quantized vector column
+QUANTIZATIONS = {
+    "none": ("{column}", "vector"),
+    "halfvec": ("({column}::halfvec({dim}))", "halfvec"),
+    "bit": ("(binary_quantize({column})::bit({dim}))", "bit"),
+}
+
+
+def vector_ops(quantization: str, method: str) -> Tuple[str, str]:
+    """Distance operator and operator class of a quantization and method."""
+    if quantization == "bit":
+        # sign bits, hamming distance whatever the method
+        return "<~>", "bit_hamming_ops"
+    operator, ops = METHODS[method]
+
+    return operator, f"{QUANTIZATIONS[quantization][1]}_{ops}"
+
 
 class PgSyncDb:
     """Postgresql syncronous db module."""
 
-    def __init__(self, host: str, port: int, user: str, password: str, db: str) -> None:
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        db: str,
+        index_type: Literal["hnsw", "ivfflat", "none"] = "hnsw",
+        hnsw_m: int = 16,
+        hnsw_ef_construction: int = 64,
+        ivfflat_lists: int = 100,
+        quantization: Literal["none", "halfvec", "bit"] = "none",
+        index_method: Literal["cosine", "ip", "l2"] = "ip",
+    ) -> None:
         """Initialize SQL database."""
         self.host = host
         self.port = port
         self.user = user
         self.password = password
         self.db = db
+        self.index_type = index_type
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.ivfflat_lists = ivfflat_lists
+        self.quantization = quantization
+        self.index_method = index_method
 
         self.url = f"postgresql://{self.user}:{self.password}@{self.host}:{self.port}/{self.db}"
 
@@ -32,17 +97,352 @@ class PgSyncDb:
             url=self.url,
             echo=False,
         )
-        self.session = Session(self.engine)
 
-        # test connection
-        self.session.exec(text("SELECT 1"))
+        with self.engine.begin() as conn:
+            # test connection
+            conn.execute(text("SELECT 1"))
 
-        # pg vector extension
-        self.session.exec(text("CREATE EXTENSION IF NOT EXISTS vector"))
+            # pg vector extension
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
 
         log.log(22, f"Connected SQL to {self.host}:{self.port}/{self.db}")
 
+    def dispose(self, close: bool = True) -> None:
+        """
+        Drop the pooled connections. Call it before forking workers, and with
+        `close=False` in a forked worker, so a worker never reuses (or closes)
+        the connections of its parent.
+        """
+        self.engine.dispose(close=close)
+
+    @contextmanager
+    def get_session(self) -> Iterator[Session]:
+        """Get a new session from the connection pool (one per request)."""
+        with Session(self.engine) as session:
+            yield session
+
+    def copy_rows(
+        self,
+        table: str,
+        columns: List[str],
+        rows: Sequence[Sequence[Any]],
+        post_statement: Optional[str] = None,
+        post_params: Optional[Dict[str, Any]] = None,
+        staging: bool = False,
+    ) -> List[tuple]:
+        """
+        Bulk insert rows with COPY (csv) in a single transaction, followed by
+        an optional `post_statement` (psycopg2 `%(name)s` params). With
+        `staging`, rows are copied into a temporary `{table}_staging` table
+        (dropped on commit) for the `post_statement` to insert, e.g. with
+        `ON CONFLICT`. Returns the rows of the `post_statement`, if any.
+        """
+        if not rows:
+            return []
+        buffer = StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+
+        target = f"{table}_staging" if staging else table
+        results: List[tuple] = []
+        conn = self.engine.raw_connection()
+        try:
+            with conn.cursor() as cursor:
+                if staging:
+                    cursor.execute(
+                        f"CREATE TEMP TABLE {target} ON COMMIT DROP AS "
+                        f"SELECT {', '.join(columns)} FROM {table} WITH NO DATA"
+                    )
+                cursor.copy_expert(
+                    f"COPY {target} ({', '.join(columns)}) "
+                    "FROM STDIN WITH (FORMAT csv)",
+                    buffer,
+                )
+                if post_statement is not None:
+                    cursor.execute(post_statement, post_params)
+                    if cursor.description is not None:
+                        results = cursor.fetchall()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        log.log(22, f"Copied {len(rows)} rows into {target}")
+
+        return results
+
     def create_all(self) -> None:
         """Create all tables."""
         log.log(22, "Creating all tables...")
         SQLModel.metadata.create_all(self.engine)
+        self.create_indexes()
+        self.create_vector_indexes()
+        self.migrate()
+
+    def migrate(self) -> None:
+        """Apply the data migrations not applied yet, each in a transaction."""
+        with self.engine.begin() as conn:
+            conn.execute(
+                text(
+                    "CREATE TABLE IF NOT EXISTS schema_migrations ("
+                    "name TEXT PRIMARY KEY, applied_at TIMESTAMP NOT NULL DEFAULT now())"
+                )
+            )
+        for name, statements in MIGRATIONS:
+            with self.engine.begin() as conn:
+                # workers starting together apply a migration once
+                conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('migrate'))"))
+                applied = conn.execute(
+                    text("SELECT 1 FROM schema_migrations WHERE name = :name"),
+                    {"name": name},
+                ).first()
+                if applied:
+                    continue
+
+                log.log(22, f"Applying migration {name}...")
+                for statement in statements:
+                    conn.execute(text(statement))
+                conn.execute(
+                    text("INSERT INTO schema_migrations (name) VALUES (:name)"),
+                    {"name": name},
+                )
+
+    def create_indexes(self) -> None:
+        """Create the (unique) indexes missing from tables created before."""
+        with self.engine.begin() as conn:
+            for table in SQLModel.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(conn, checkfirst=True)
+                for column in table.columns:
+                    if not column.unique:
+                        continue
+
+                    # same name as the constraint of a newly created table
+                    index_name = f"{table.name}_{column.name}_key"
+                    try:
+                        conn.execute(
+                            text(
+                                f"CREATE UNIQUE INDEX IF NOT EXISTS {index_name} "
+                                f"ON {table.name} ({column.name})"
+                            )
+                        )
+                    except IntegrityError:
+                        log.error(
+                            f"Cannot create unique index {index_name}, "
+                            f"remove the duplicated {table.name}.{column.name} first"
+                        )
+                        raise
+
+    def create_vector_indexes(self) -> None:
+        """
+        Create an ANN index on every vector column, with the operator class of
+        the search method (`<#>` inner product by default, embeddings are
+        normalized). With a quantization, the index is built on the halfvec or
+        binary quantized expression of the column, and the float column is
+        kept for re-ranking. IVFFlat lists are trained on the rows present at
+        build time, so an IVFFlat index is deferred until the table has at
+        least `ivfflat_lists` rows.
+        """
+        index_types = ["hnsw", "ivfflat"]
+        with self.engine.begin() as conn:
+            for table in SQLModel.metadata.sorted_tables:
+                for column in table.columns:
+                    if not isinstance(column.type, Vector):
+                        continue
+                    if column.info.get("vector_index") is False:
+                        continue
+
+                    # drop the indexes of other types, quantizations or methods
+                    index_name = self.vector_index_name(
+                        column, self.index_type, self.quantization, self.index_method
+                    )
+                    other_names = {
+                        self.vector_index_name(column, index_type, quantization, method)
+                        for index_type in index_types
+                        for quantization in QUANTIZATIONS
+                        for method in METHODS
+                    }
+                    for other_name in sorted(other_names - {index_name}):
+                        conn.execute(text(f"DROP INDEX IF EXISTS {other_name}"))
+                    if self.index_type == "none":
+                        continue
+
+                    exists = conn.execute(
+                        text("SELECT to_regclass(:name)"), {"name": index_name}
+                    ).scalar()
+                    if exists:
+                        continue
+                    if self.index_type == "ivfflat" and not self.has_rows(
+                        conn, table.name, self.ivfflat_lists
+                    ):
+                        log.log(
+                            22,
+                            f"Deferring ivfflat index {index_name} until "
+                            f"{table.name} has {self.ivfflat_lists} rows",
+                        )
+                        continue
+
+                    if self.index_type == "hnsw":
+                        params = (
+                            f"m = {int(self.hnsw_m)}, "
+                            f"ef_construction = {int(self.hnsw_ef_construction)}"
+                        )
+                    else:
+                        params = f"lists = {int(self.ivfflat_lists)}"
+                    expression = QUANTIZATIONS[self.quantization][0].format(
+                        column=column.name, dim=column.type.dim
+                    )
+                    _, ops = vector_ops(self.quantization, self.index_method)
+                    log.log(22, f"Creating {self.index_type} index {index_name}...")
+                    conn.execute(
+                        text(
+                            f"CREATE INDEX IF NOT EXISTS {index_name} "
+                            f"ON {table.name} USING {self.index_type} "
+                            f"({expression} {ops}) WITH ({params})"
+                        )
+                    )
+
+    def reindex_vector_indexes(self) -> None:
+        """
+        Rebuild the ANN index of every vector column, e.g. to retrain the
+        IVFFlat lists after the table has grown.
+        """
+        self.create_vector_indexes()
+        with self.engine.begin() as conn:
+            for table in SQLModel.metadata.sorted_tables:
+                for column in table.columns:
+                    if not isinstance(column.type, Vector):
+                        continue
+                    if column.info.get("vector_index") is False:
+                        continue
+                    index_name = self.vector_index_name(
+                        column, self.index_type, self.quantization, self.index_method
+                    )
+                    exists = conn.execute(
+                        text("SELECT to_regclass(:name)"), {"name": index_name}
+                    ).scalar()
+                    if exists:
+                        log.log(22, f"Rebuilding index {index_name}...")
+                        conn.execute(text(f"REINDEX INDEX {index_name}"))
+
+    @staticmethod
+    def has_rows(conn: Any, table: str, count: int) -> bool:
+        """Whether a table has at least `count` rows (without a full count)."""
+        rows = conn.execute(
+            text(f"SELECT count(*) FROM (SELECT 1 FROM {table} LIMIT :count) AS t"),
+            {"count": count},
+        ).scalar()
+
+        return rows >= count
+
+    @staticmethod
+    def vector_index_name(
+        column: Any, index_type: str, quantization: str, method: str
+    ) -> str:
+        """Name of the ANN index of a vector column."""
+        parts = [column.table.name, column.name]
+        if quantization != "none":
+            parts.append(quantization)
+        if method != "cosine" and quantization != "bit":
+            parts.append(method)
+
+        return "_".join(parts + [index_type, "idx"])
+
+
+class PgAsyncDb:
+    """
+    Postgresql asynchronous db module.
+
+    Uses asyncpg behind a SQLAlchemy connection pool, one session per
+    request. pgvector values go through asyncpg's text I/O, which is what
+    the SQLAlchemy `Vector` type binds and parses.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        db: str,
+        pool_size: int = 10,
+        max_overflow: int = 10,
+        pool_timeout: float = 10.0,
+        pool_recycle: int = 1800,
+        hnsw_ef_search: int = 40,
+        ivfflat_probes: int = 1,
+    ) -> None:
+        """Initialize async SQL database."""
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.db = db
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_timeout = pool_timeout
+        self.pool_recycle = pool_recycle
+        self.hnsw_ef_search = hnsw_ef_search
+        self.ivfflat_probes = ivfflat_probes
+
+        self.url = f"postgresql+asyncpg://{self.user}:{self.password}@{self.host}:{self.port}/{self.db}"
+        self.engine = None
+
+    async def setup(self) -> None:
+        """Setup async SQL database and its connection pool."""
+        log.log(22, f"Connecting async SQL to {self.host}:{self.port}/{self.db}...")
+        self.engine = create_async_engine(
+            url=self.url,
+            echo=False,
+            pool_size=self.pool_size,
+            max_overflow=self.max_overflow,
+            pool_timeout=self.pool_timeout,
+            pool_recycle=self.pool_recycle,
+            pool_pre_ping=True,
+            connect_args={
+                "server_settings": {
+                    "hnsw.ef_search": str(self.hnsw_ef_search),
+                    "ivfflat.probes": str(self.ivfflat_probes),
+                }
+            },
+        )
+
+        async with self.engine.begin() as conn:
+            # test connection
+            await conn.execute(text("SELECT 1"))
+
+            # pg vector extension
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+
+        log.log(22, f"Connected async SQL to {self.host}:{self.port}/{self.db}")
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[AsyncSession]:
+        """Get a new session from the connection pool (one per request)."""
+        try:
+            async with AsyncSession(self.engine, expire_on_commit=False) as session:
+                yield session
+        except PoolTimeoutError as e:
+            log.warning(f"SQL connection pool exhausted: {self.pool_status()}")
+            raise ExecutorBusyError("Database connection pool is busy") from e
+
+    def pool_status(self) -> Dict[str, int]:
+        """Connection pool utilization."""
+        if self.engine is None:
+            return {}
+        pool = self.engine.sync_engine.pool
+
+        return {
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": self.max_overflow,
+        }
+
+    async def close(self) -> None:
+        """Dispose the connection pool."""
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = None
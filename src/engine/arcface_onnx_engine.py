@@ -4,12 +4,13 @@ import rootutils
 
 ROOT = rootutils.autosetup()
 
-from typing import List
+from typing import List, Optional
 
 import cv2
 import numpy as np
 
 from src.engine.onnx_engine import CommonOnnxEngine
+from src.schema.onnx_schema import OnnxSessionSchema
 from src.utils.logger import get_logger
 
 log = get_logger()
@@ -18,27 +19,45 @@ log = get_logger()
 class ArcfaceOnnxEngine(CommonOnnxEngine):
     """Arcface ONNX engine module."""
 
-    def __init__(self, engine_path: str, provider: str = "cpu") -> None:
+    def __init__(
+        self,
+        engine_path: str,
+        provider: str = "cpu",
+        io_binding: bool = False,
+        session: Optional[OnnxSessionSchema] = None,
+    ) -> None:
         """Initialize Arcface ONNX engine."""
-        super().__init__(engine_path, provider)
+        super().__init__(engine_path, provider, io_binding, session)
 
-    def predict(self, imgs: List[np.ndarray]) -> np.ndarray:
-        """Predict embeddings from image(s)."""
-        imgs = self.preprocess_imgs(imgs)
-        outputs = self.engine.run(None, {self.metadata[0].input_name: imgs})
+    def predict(
+        self, imgs: List[np.ndarray], matrices: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """Predict embeddings from image(s), aligned with `matrices` if given."""
+        imgs = self.preprocess_imgs(imgs, matrices)
+        outputs = self.run(imgs)
 
         return outputs[0]
 
-    def preprocess_imgs(self, imgs: List[np.ndarray]) -> np.ndarray:
-        """Preprocess images (faces)."""
-        # resize faces
+    def preprocess_imgs(
+        self, imgs: List[np.ndarray], matrices: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Preprocess images (faces), resized or warped by affine `matrices`, into
+        a reused contiguous NCHW float32 buffer.
+        """
         dst_h, dst_w = self.img_shape
-        resized_imgs = np.zeros((len(imgs), dst_h, dst_w, 3), dtype=np.float32)
+        inputs = self.get_buffer("input", (len(imgs), 3, dst_h, dst_w))
         for i, img in enumerate(imgs):
-            resized_imgs[i] = cv2.resize(img, (dst_w, dst_h))
+            # resize or align faces, a single warp per face
+            if matrices is None:
+                img = cv2.resize(img, (dst_w, dst_h))
+            else:
+                img = cv2.warpAffine(img, matrices[i], (dst_w, dst_h))
+
+            # uint8 HWC -> float32 CHW in one pass
+            np.copyto(inputs[i], img.transpose((2, 0, 1)), casting="unsafe")
 
         # normalize faces
-        resized_imgs = resized_imgs.transpose(0, 3, 1, 2)
-        resized_imgs /= 255.0
+        inputs /= 255.0
 
-        return resized_imgs
+        return inputs
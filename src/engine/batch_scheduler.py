@@ -0,0 +1,161 @@
+"""Face recognition micro-batching scheduler."""
+
+import rootutils
+
+ROOT = rootutils.autosetup()
+
+import asyncio
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+import numpy as np
+
+from src.engine.fr_onnx_engine import FrOnnxEngine
+from src.schema.fr_schema import FrResultSchema
+from src.utils.executor import BoundedExecutor, ExecutorBusyError
+from src.utils.image import EncodedImage
+from src.utils.logger import get_logger
+
+log = get_logger()
+
+
+class FrBatchScheduler:
+    """
+    Face recognition dynamic micro-batching scheduler.
+
+    Concurrent requests are collected for at most `max_wait_ms` (or until
+    `max_batch_size` images are queued) and run through a single batched
+    `FrOnnxEngine.predict` call. Each caller awaits its own future.
+
+    Batches run on `executor`, at most `executor.max_workers` at a time. While
+    all workers are busy, incoming requests accumulate into the next batch;
+    once `max_queue` images are waiting, new requests are rejected with
+    `ExecutorBusyError`.
+    """
+
+    def __init__(
+        self,
+        engine: FrOnnxEngine,
+        executor: BoundedExecutor,
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0,
+        max_queue: int = 64,
+    ) -> None:
+        """Initialize face recognition batch scheduler."""
+        self.engine = engine
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker: Optional[asyncio.Task] = None
+        self.slots: Optional[asyncio.Semaphore] = None
+        self.tasks: Set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        """Start the scheduler worker on the running event loop."""
+        if self.worker is not None and not self.worker.done():
+            return
+        log.info(
+            f"Start batch scheduler (max batch: {self.max_batch_size}, "
+            f"max wait: {self.max_wait * 1000:.1f} ms)"
+        )
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        self.slots = asyncio.Semaphore(self.executor.max_workers)
+        self.worker = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stop the scheduler worker."""
+        if self.worker is None:
+            return
+        self.worker.cancel()
+        try:
+            await self.worker
+        except asyncio.CancelledError:
+            pass
+        self.worker = None
+
+    async def predict(
+        self,
+        img: Union[np.ndarray, EncodedImage],
+        det_conf: float = 0.25,
+        det_nms: float = 0.45,
+    ) -> FrResultSchema:
+        """Queue a single image and wait for its batched result."""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((img, det_conf, det_nms, future))
+        except asyncio.QueueFull:
+            log.warning(f"Batch scheduler queue is full ({self.max_queue} pending)")
+            raise ExecutorBusyError("Face recognition engine is busy")
+
+        return await future
+
+    async def run(self) -> None:
+        """Collect queued requests into batches and process them."""
+        loop = asyncio.get_running_loop()
+        while True:
+            # wait for a free worker before collecting the next batch
+            await self.slots.acquire()
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # detection thresholds are per call, so group by them
+            groups: Dict[Tuple[float, float], List[tuple]] = {}
+            for item in batch:
+                groups.setdefault((item[1], item[2]), []).append(item)
+            task = asyncio.create_task(self.process(list(groups.items())))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def process(self, groups: List[Tuple[Tuple[float, float], List[tuple]]]):
+        """Run batched predictions and resolve the callers' futures."""
+        try:
+            for (det_conf, det_nms), items in groups:
+                await self.process_group(items, det_conf, det_nms)
+        finally:
+            self.slots.release()
+
+    async def process_group(
+        self, items: List[tuple], det_conf: float, det_nms: float
+    ) -> None:
+        """Run one batched prediction for a threshold group."""
+        items = [item for item in items if not item[3].done()]
+        if not items:
+            return
+
+        log.debug(f"Batch scheduler running batch of {len(items)}")
+        imgs = [item[0] for item in items]
+        try:
+            results = await self.executor.run(
+                self.engine.predict, imgs, det_conf, det_nms
+            )
+        except ExecutorBusyError as e:
+            for item in items:
+                if not item[3].done():
+                    item[3].set_exception(e)
+            return
+        except Exception as e:
+            if len(items) == 1:
+                if not items[0][3].done():
+                    items[0][3].set_exception(e)
+                return
+
+            # one bad image fails the batch, retry one by one to isolate it
+            log.warning(f"Batch of {len(items)} failed ({e!r}), retrying per image")
+            for item in items:
+                await self.process_group([item], det_conf, det_nms)
+            return
+
+        for item, result in zip(items, results):
+            if not item[3].done():
+                item[3].set_result(result)
@@ -0,0 +1,134 @@
+"""Face IoU tracker."""
+
+import rootutils
+
+ROOT = rootutils.autosetup()
+
+import time
+from typing import List, Optional, Union
+
+import numpy as np
+
+from src.utils.logger import get_logger
+
+log = get_logger()
+
+
+def iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of two sets of xyxy boxes, shape (len(a), len(b))."""
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+
+    return inter / np.maximum(union, 1e-6)
+
+
+class FaceTrack:
+    """Single face track."""
+
+    def __init__(self, track_id: int, box: List[int]) -> None:
+        """Initialize face track."""
+        self.track_id = track_id
+        self.box = np.asarray(box, dtype=np.float32)
+        self.velocity = np.zeros(4, dtype=np.float32)
+        self.misses = 0
+
+        # identity, refreshed when the track is (re-)embedded
+        self.match: Optional[List[dict]] = None
+        self.embedded_box: Optional[np.ndarray] = None
+        self.embedded_at = 0.0
+
+    def predict(self) -> np.ndarray:
+        """Predicted box in the next frame (constant velocity)."""
+        return self.box + self.velocity
+
+    def update(self, box: List[int]) -> None:
+        """Update the track with a matched detection."""
+        box = np.asarray(box, dtype=np.float32)
+        self.velocity = 0.5 * self.velocity + 0.5 * (box - self.box)
+        self.box = box
+        self.misses = 0
+
+    def set_match(self, match: List[dict]) -> None:
+        """Store the identity resolved from the current box."""
+        self.match = match
+        self.embedded_box = self.box.copy()
+        self.embedded_at = time.monotonic()
+
+
+class FaceTracker:
+    """
+    Face IoU tracker.
+
+    Detections are greedily matched to constant-velocity predictions of the
+    live tracks by IoU. A track only needs a new embedding (and gallery query)
+    when it is new, its box moved/changed significantly since it was last
+    embedded, or its identity is older than `max_age` seconds.
+    """
+
+    def __init__(
+        self,
+        match_iou: float = 0.3,
+        reembed_iou: float = 0.6,
+        max_age: float = 2.0,
+        max_misses: int = 5,
+    ) -> None:
+        """Initialize face tracker."""
+        self.match_iou = match_iou
+        self.reembed_iou = reembed_iou
+        self.max_age = max_age
+        self.max_misses = max_misses
+
+        self.tracks: List[FaceTrack] = []
+        self.next_id = 1
+
+    def update(self, boxes: Union[List[List[int]], np.ndarray]) -> List[FaceTrack]:
+        """Match detections to tracks. Returns the track of every box, in order."""
+        results: List[Optional[FaceTrack]] = [None] * len(boxes)
+        unmatched_tracks = set(range(len(self.tracks)))
+
+        if self.tracks and len(boxes):
+            predicted = np.stack([track.predict() for track in self.tracks])
+            ious = iou_matrix(boxes, predicted)
+            # greedy assignment, highest IoU first
+            for flat in np.argsort(-ious, axis=None):
+                i, j = np.unravel_index(flat, ious.shape)
+                if ious[i, j] < self.match_iou:
+                    break
+                if results[i] is not None or j not in unmatched_tracks:
+                    continue
+                self.tracks[j].update(boxes[i])
+                results[i] = self.tracks[j]
+                unmatched_tracks.discard(j)
+
+        # age out unmatched tracks
+        for j in unmatched_tracks:
+            self.tracks[j].misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+        # new tracks
+        for i, box in enumerate(boxes):
+            if results[i] is None:
+                track = FaceTrack(self.next_id, box)
+                self.next_id += 1
+                self.tracks.append(track)
+                results[i] = track
+
+        return results
+
+    def needs_embedding(self, track: FaceTrack) -> bool:
+        """Whether a track must be re-embedded and its identity re-queried."""
+        if track.embedded_box is None:
+            return True
+        if time.monotonic() - track.embedded_at > self.max_age:
+            return True
+        iou = iou_matrix(track.box, track.embedded_box)[0, 0]
+
+        return iou < self.reembed_iou
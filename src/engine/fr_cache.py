@@ -0,0 +1,225 @@
+"""Face recognition result cache."""
+
+import rootutils
+
+ROOT = rootutils.autosetup()
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+from src.schema.fr_schema import FrResultSchema
+from src.utils.logger import get_logger
+
+log = get_logger()
+
+
+class FrResultCache:
+    """
+    Face recognition engine result cache (in-process LRU with TTL).
+
+    Entries are keyed by a hash of the encoded image bytes and the detection
+    thresholds, and hold the engine output (boxes and embeddings) only, so
+    matches are still resolved against the current gallery.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0) -> None:
+        """Initialize face recognition result cache."""
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        self.entries: "OrderedDict[str, Tuple[float, FrResultSchema]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(img_bytes: bytes, det_conf: float, det_nms: float) -> str:
+        """Cache key of an encoded image and detection thresholds."""
+        digest = hashlib.blake2b(img_bytes, digest_size=16).hexdigest()
+
+        return f"{digest}:{det_conf:g}:{det_nms:g}"
+
+    def get(self, key: str) -> Optional[FrResultSchema]:
+        """Cached result of a key, None on miss or expiry."""
+        result = self.lookup(key)
+        with self.lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return result
+
+    def put(self, key: str, result: FrResultSchema) -> None:
+        """Cache the result of a key."""
+        self.store(key, result)
+
+    async def aget(self, key: str) -> Optional[FrResultSchema]:
+        """Cached result of a key, from the event loop."""
+        return self.get(key)
+
+    async def aput(self, key: str, result: FrResultSchema) -> None:
+        """Cache the result of a key, from the event loop."""
+        self.put(key, result)
+
+    async def astats(self) -> dict:
+        """Cache size and hit/miss counters, from the event loop."""
+        return self.stats()
+
+    def lookup(self, key: str) -> Optional[FrResultSchema]:
+        """Read an entry, refreshing its recency."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+
+            return entry[1]
+
+    def store(self, key: str, result: FrResultSchema) -> None:
+        """Write an entry, evicting the least recently used ones."""
+        with self.lock:
+            self.entries[key] = (time.monotonic(), result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def size(self) -> int:
+        """Number of cached entries."""
+        return len(self.entries)
+
+    def stats(self) -> dict:
+        """Cache size and hit/miss counters."""
+        total = self.hits + self.misses
+
+        return {
+            "size": self.size(),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class SharedFrResultCache(FrResultCache):
+    """
+    Face recognition engine result cache in a local SQLite file.
+
+    Shared by the worker processes of a single host (gunicorn); each worker
+    counts its own hits and misses. SQLite calls block (up to the lock
+    `timeout` under writer contention), so the async methods run them in a
+    thread, and the least recently used entries are evicted every
+    `evict_interval` writes rather than on each one.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_size: int = 1024,
+        ttl: float = 300.0,
+        evict_interval: int = 32,
+    ) -> None:
+        """Initialize shared face recognition result cache."""
+        super().__init__(max_size=max_size, ttl=ttl)
+        self.evict_interval = evict_interval
+        self.writes = 0
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.local = threading.local()
+        log.info(f"Shared result cache at {self.path}")
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        SQLite connection of the current thread, opened on first use. It is
+        keyed by process id: connections inherited by a forked worker are left
+        alone, never used.
+        """
+        conns = self.local.__dict__.setdefault("conns", {})
+        conn = conns.get(os.getpid())
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS results_accessed_at_idx "
+                "ON results (accessed_at)"
+            )
+            conns[os.getpid()] = conn
+
+        return conn
+
+    async def aget(self, key: str) -> Optional[FrResultSchema]:
+        """Cached result of a key, read in a thread."""
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, result: FrResultSchema) -> None:
+        """Cache the result of a key, written in a thread."""
+        await asyncio.to_thread(self.put, key, result)
+
+    async def astats(self) -> dict:
+        """Cache size and hit/miss counters, counted in a thread."""
+        return await asyncio.to_thread(self.stats)
+
+    def lookup(self, key: str) -> Optional[FrResultSchema]:
+        """Read an entry, refreshing its recency."""
+        now = time.time()
+        try:
+            conn = self.connect()
+            row = conn.execute(
+                "SELECT value, created_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            log.warning(f"Shared result cache lookup failed: {e}")
+            return None
+
+        return FrResultSchema.model_validate_json(row[0])
+
+    def store(self, key: str, result: FrResultSchema) -> None:
+        """Write an entry, evicting the least recently used ones."""
+        now = time.time()
+        try:
+            conn = self.connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (key, result.model_dump_json(), now, now),
+            )
+            with self.lock:
+                self.writes += 1
+                evict = self.writes % self.evict_interval == 0
+            if evict:
+                conn.execute(
+                    "DELETE FROM results WHERE key IN ("
+                    "SELECT key FROM results ORDER BY accessed_at DESC "
+                    "LIMIT -1 OFFSET ?)",
+                    (self.max_size,),
+                )
+        except sqlite3.Error as e:
+            log.warning(f"Shared result cache store failed: {e}")
+
+    def size(self) -> int:
+        """Number of cached entries."""
+        try:
+            return self.connect().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        except sqlite3.Error:
+            return 0
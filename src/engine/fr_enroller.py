@@ -0,0 +1,272 @@
+"""Face recognition bulk enrollment."""
+
+import rootutils
+
+ROOT = rootutils.autosetup()
+
+import json
+import tarfile
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Deque, Iterator, List, Optional, Set, Tuple, Union
+
+from sqlmodel import select
+
+from src.db.pg_db import PgSyncDb
+from src.engine.fr_onnx_engine import FrOnnxEngine
+from src.schema.fr_schema import (
+    EnrollFrSchema,
+    EnrollRejectFrSchema,
+    FaceEmbeddingsFrSqlSchema,
+    FacesFrSqlSchema,
+    FrResultSchema,
+)
+from src.utils.image import IMAGE_SUFFIXES, EncodedImage
+from src.utils.logger import get_logger
+
+log = get_logger()
+
+
+def iter_images(source: Union[str, Path, IO[bytes]]) -> Iterator[Tuple[str, bytes]]:
+    """
+    Stream (filename, bytes) of every image of a directory (recursive) or a
+    zip/tar archive, without loading the whole source in memory.
+    """
+    if isinstance(source, (str, Path)) and Path(source).is_dir():
+        for path in sorted(Path(source).rglob("*")):
+            if path.is_file() and path.suffix.lower() in IMAGE_SUFFIXES:
+                yield str(path.relative_to(source)), path.read_bytes()
+        return
+
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if Path(info.filename).suffix.lower() in IMAGE_SUFFIXES:
+                    yield info.filename, archive.read(info)
+        return
+
+    if not isinstance(source, (str, Path)):
+        source.seek(0)
+    with tarfile.open(
+        name=source if isinstance(source, (str, Path)) else None,
+        fileobj=None if isinstance(source, (str, Path)) else source,
+        mode="r|*",
+    ) as archive:
+        for member in archive:
+            if member.isfile() and Path(member.name).suffix.lower() in IMAGE_SUFFIXES:
+                yield member.name, archive.extractfile(member).read()
+
+
+class FrBulkEnroller:
+    """
+    Face recognition bulk enrollment.
+
+    Images are decoded and embedded in parallel batches, and the accepted
+    faces are written with `COPY` in transactions of `commit_size` rows. The
+    identity name is the image file name without suffix. Images without a
+    face, with multiple faces, or with an already registered name are
+    rejected. With a `progress_path`, processed files are recorded after each
+    commit and skipped when the enrollment is run again.
+    """
+
+    def __init__(
+        self,
+        engine: FrOnnxEngine,
+        pg: PgSyncDb,
+        batch_size: int = 32,
+        workers: int = 2,
+        commit_size: int = 5000,
+        det_side: Optional[int] = None,
+    ) -> None:
+        """Initialize face recognition bulk enrollment."""
+        self.engine = engine
+        self.pg = pg
+        self.batch_size = batch_size
+        self.workers = workers
+        self.commit_size = commit_size
+        self.det_side = det_side
+
+    def enroll(
+        self,
+        source: Union[str, Path, IO[bytes]],
+        det_conf: float = 0.25,
+        det_nms: float = 0.45,
+        progress_path: Optional[str] = None,
+        report_path: Optional[str] = None,
+    ) -> EnrollFrSchema:
+        """Enroll every image of a directory or archive."""
+        done = self.read_progress(progress_path)
+        names = self.db_names()
+        result = EnrollFrSchema(skipped=len(done))
+        rows: List[Tuple[str, str, str]] = []
+        filenames: List[str] = []
+        rejects: List[EnrollRejectFrSchema] = []
+        log.info(
+            f"Bulk enrollment started ({len(names)} registered, "
+            f"{len(done)} already processed)"
+        )
+
+        def flush() -> None:
+            if rows:
+                inserted = self.db_copy_faces([(name, embd) for _, name, embd in rows])
+                # registered by another client since `db_names`
+                rejects.extend(
+                    EnrollRejectFrSchema(
+                        filename=filename, name=name, reason="duplicate"
+                    )
+                    for filename, name, _ in rows
+                    if name not in inserted
+                )
+                result.enrolled += len(inserted)
+            self.write_progress(progress_path, filenames, report_path, rejects)
+            result.rejected += rejects
+            log.info(
+                f"Bulk enrollment: {result.enrolled} enrolled, "
+                f"{len(result.rejected)} rejected"
+            )
+            rows.clear()
+            filenames.clear()
+            rejects.clear()
+
+        def reject(filename: str, name: str, reason: str) -> None:
+            rejects.append(
+                EnrollRejectFrSchema(filename=filename, name=name, reason=reason)
+            )
+            filenames.append(filename)
+
+        batches = self.iter_batches(source, done)
+        for batch, faces in self.predict_batches(batches, det_conf, det_nms):
+            for (filename, error), result_faces in zip(batch, faces):
+                name = Path(filename).stem
+                if error is not None:
+                    reject(filename, name, error)
+                elif len(result_faces.boxes) == 0:
+                    reject(filename, name, "no face")
+                elif len(result_faces.boxes) > 1:
+                    reject(filename, name, "multiple faces")
+                elif name in names:
+                    reject(filename, name, "duplicate")
+                else:
+                    names.add(name)
+                    embd = result_faces.embeddings[0]
+                    rows.append((filename, name, "[" + ",".join(map(str, embd)) + "]"))
+                    filenames.append(filename)
+            if len(filenames) >= self.commit_size:
+                flush()
+        if filenames:
+            flush()
+
+        log.info(
+            f"Bulk enrollment done: {result.enrolled} enrolled, "
+            f"{len(result.rejected)} rejected, {result.skipped} skipped"
+        )
+
+        return result
+
+    def iter_batches(
+        self, source: Union[str, Path, IO[bytes]], done: Set[str]
+    ) -> Iterator[List[Tuple[str, bytes]]]:
+        """Batches of not yet processed (filename, bytes)."""
+        batch: List[Tuple[str, bytes]] = []
+        for filename, img_bytes in iter_images(source):
+            if filename in done:
+                continue
+            batch.append((filename, img_bytes))
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def predict_batches(
+        self,
+        batches: Iterator[List[Tuple[str, bytes]]],
+        det_conf: float,
+        det_nms: float,
+    ) -> Iterator[Tuple[List[Tuple[str, Optional[str]]], List[FrResultSchema]]]:
+        """Decode and embed batches on `workers` threads, yielded in order."""
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="enroll") as pool:
+            pending: Deque[Future] = deque()
+            for batch in batches:
+                pending.append(pool.submit(self.predict, batch, det_conf, det_nms))
+                # bounded read-ahead
+                if len(pending) >= 2 * self.workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def predict(
+        self, batch: List[Tuple[str, bytes]], det_conf: float, det_nms: float
+    ) -> Tuple[List[Tuple[str, Optional[str]]], List[FrResultSchema]]:
+        """Decode and embed a batch. Undecodable images get an error."""
+        items: List[Tuple[str, Optional[str]]] = []
+        imgs: List[EncodedImage] = []
+        for filename, img_bytes in batch:
+            try:
+                imgs.append(EncodedImage(img_bytes, self.det_side))
+                items.append((filename, None))
+            except (OSError, ValueError):
+                items.append((filename, "invalid image"))
+
+        faces = iter(self.engine.predict(imgs, det_conf, det_nms) if imgs else [])
+
+        return items, [FrResultSchema() if error else next(faces) for _, error in items]
+
+    def db_names(self) -> Set[str]:
+        """Names already registered in the database."""
+        with self.pg.get_session() as session:
+            return set(session.exec(select(FacesFrSqlSchema.name)).all())
+
+    def db_copy_faces(self, rows: List[Tuple[str, str]]) -> Set[str]:
+        """
+        Insert faces (name, embedding text) with COPY, and their embedding as
+        their first sample, in one transaction. Names registered meanwhile
+        are skipped. Returns the inserted names.
+        """
+        now = datetime.now().isoformat()
+        faces = FacesFrSqlSchema.__tablename__
+        inserted = self.pg.copy_rows(
+            table=faces,
+            columns=["name", "embedding", "created_at", "updated_at"],
+            rows=[(name, embd, now, now) for name, embd in rows],
+            post_statement=(
+                "WITH inserted AS ("
+                f"INSERT INTO {faces} (name, embedding, created_at, updated_at) "
+                f"SELECT name, embedding, created_at, updated_at FROM {faces}_staging "
+                "ON CONFLICT (name) DO NOTHING "
+                "RETURNING id, name, embedding, created_at"
+                "), samples AS ("
+                f"INSERT INTO {FaceEmbeddingsFrSqlSchema.__tablename__} "
+                "(face_id, embedding, created_at) "
+                "SELECT id, embedding, created_at FROM inserted"
+                ") SELECT name FROM inserted"
+            ),
+            staging=True,
+        )
+
+        return {name for (name,) in inserted}
+
+    def read_progress(self, progress_path: Optional[str]) -> Set[str]:
+        """Files already processed by a previous run."""
+        if not progress_path or not Path(progress_path).exists():
+            return set()
+        with open(progress_path) as f:
+            return {json.loads(line) for line in f if line.strip()}
+
+    def write_progress(
+        self,
+        progress_path: Optional[str],
+        filenames: List[str],
+        report_path: Optional[str],
+        rejects: List[EnrollRejectFrSchema],
+    ) -> None:
+        """Record processed files and rejects, after their rows are committed."""
+        if report_path and rejects:
+            with open(report_path, "a") as f:
+                f.writelines(reject.model_dump_json() + "\n" for reject in rejects)
+        if progress_path:
+            with open(progress_path, "a") as f:
+                f.writelines(json.dumps(filename) + "\n" for filename in filenames)
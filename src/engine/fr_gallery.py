@@ -0,0 +1,783 @@
+"""Face recognition in-memory embedding gallery."""
+
+import rootutils
+
+ROOT = rootutils.autosetup()
+
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Literal, Optional, Set, TextIO, Tuple
+
+import numpy as np
+
+from src.utils.logger import get_logger
+
+log = get_logger()
+
+
+def l2_normalize(embds: np.ndarray) -> np.ndarray:
+    """L2-normalize embeddings along the last axis (float32)."""
+    embds = np.asarray(embds, dtype=np.float32)
+    norms = np.linalg.norm(embds, axis=-1, keepdims=True)
+    np.maximum(norms, 1e-12, out=norms)
+
+    return embds / norms
+
+
+def pack_bits(embds: np.ndarray) -> np.ndarray:
+    """Binary quantize embeddings (sign bits, as pgvector `binary_quantize`)."""
+    return np.packbits(np.asarray(embds) > 0, axis=-1)
+
+
+def hamming_distances(query_codes: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """Hamming distances (q, n) between packed bit codes, 64 bits at a time."""
+    queries = np.ascontiguousarray(query_codes).view(np.uint64)
+    dists = np.empty((len(queries), len(codes)), dtype=np.int32)
+    m1, m2, m4, h01 = (
+        np.uint64(m)
+        for m in (
+            0x5555555555555555,
+            0x3333333333333333,
+            0x0F0F0F0F0F0F0F0F,
+            0x0101010101010101,
+        )
+    )
+
+    # chunks of 64k words, xor temporaries stay in cache
+    chunk = max(1, 65536 // max(queries.size, 1))
+    for start in range(0, len(codes), chunk):
+        block = np.ascontiguousarray(codes[start : start + chunk]).view(np.uint64)
+        x = np.bitwise_xor(queries[:, None, :], block[None, :, :])
+
+        # in-place popcount (SWAR)
+        x -= (x >> np.uint64(1)) & m1
+        y = x >> np.uint64(2)
+        y &= m2
+        x &= m2
+        x += y
+        x += x >> np.uint64(4)
+        x &= m4
+        x *= h01
+        x >>= np.uint64(56)
+        dists[:, start : start + len(block)] = x.sum(axis=-1, dtype=np.int32)
+
+    return dists
+
+
+class FrGallery:
+    """
+    Face recognition in-memory embedding gallery.
+
+    Embeddings are kept L2-normalized in one contiguous float32 matrix, so
+    cosine distance for all queries of a batch is a single matrix multiply.
+    Postgres stays the source of truth; the gallery is loaded from it and
+    kept in sync with register/delete calls. Calls made while a snapshot is
+    read from the database (between `begin_sync` and `load`) are journaled
+    and replayed over the snapshot, so a reload never undoes them.
+
+    With `quantization`, embeddings are kept as float16 ("halfvec", half the
+    memory). With "bit", their sign bits are kept too: a hamming distance scan
+    selects `k * rerank_factor` candidates, re-ranked by cosine distance. The
+    float16 embeddings stay for the re-rank, so "bit" takes the memory of
+    "halfvec" plus 1/16 (the codes), it trades recall for a cheaper scan.
+
+    Each face is an identity searched by its centroid embedding. With
+    `search_samples`, the `k * rerank_factor` nearest identities are re-ranked
+    by their closest sample embedding, so the search cost still scales with
+    the number of identities.
+    """
+
+    def __init__(
+        self,
+        dim: int = 512,
+        capacity: int = 1024,
+        quantization: Literal["none", "halfvec", "bit"] = "none",
+        rerank_factor: int = 4,
+        search_samples: bool = False,
+    ) -> None:
+        """Initialize face recognition gallery."""
+        self.dim = dim
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        self.search_samples = search_samples
+        self.dtype = np.float32 if quantization == "none" else np.float16
+        self.code_size = dim // 8 if quantization == "bit" else 0
+        self.lock = threading.RLock()
+        self.journal: Optional[List[Tuple[str, tuple]]] = None
+        self.reset(capacity)
+
+    def reset(self, capacity: int = 1024) -> None:
+        """Clear the gallery."""
+        with self.lock:
+            self.size = 0
+            self.embds = np.zeros((max(capacity, 1), self.dim), dtype=self.dtype)
+            self.codes = np.zeros((max(capacity, 1), self.code_size), dtype=np.uint8)
+            self.ids = np.zeros((max(capacity, 1),), dtype=np.int64)
+            self.metas: List[Tuple[str, datetime, datetime]] = []
+            self.rows: Dict[int, int] = {}
+            self.samples: Dict[int, np.ndarray] = {}
+            self.synced_at = 0.0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def begin_sync(self, max_age: Optional[float] = None) -> bool:
+        """
+        Start journaling changes, before reading a snapshot to `load`. Return
+        False (nothing to load) if not stale given `max_age`.
+        """
+        if max_age is not None and not self.is_stale(max_age):
+            return False
+        self.journal = []
+
+        return True
+
+    def end_sync(self) -> None:
+        """Stop journaling changes (the snapshot is loaded, or failed)."""
+        self.journal = None
+
+    def load(
+        self,
+        ids: List[int],
+        metas: List[Tuple[str, datetime, datetime]],
+        embds: np.ndarray,
+        samples: Optional[List[np.ndarray]] = None,
+    ) -> None:
+        """
+        Replace the gallery content (e.g. a full sync from the database), with
+        the sample embeddings of every face if searched. Changes journaled
+        since `begin_sync` are replayed over it.
+        """
+        embds = l2_normalize(np.asarray(embds).reshape(-1, self.dim))
+        codes = pack_bits(embds)[:, : self.code_size]
+        new_ids = np.asarray(ids, dtype=np.int64)
+        rows = {int(face_id): row for row, face_id in enumerate(new_ids)}
+        new_samples = {
+            int(face_id): self.normalize_samples(face_samples)
+            for face_id, face_samples in zip(new_ids, samples or [])
+        }
+
+        # with headroom, the next adds do not copy the whole gallery
+        size = len(new_ids)
+        capacity = max(size + size // 4, 1)
+        new_embds = np.zeros((capacity, self.dim), dtype=self.dtype)
+        new_embds[:size] = embds
+        new_codes = np.zeros((capacity, self.code_size), dtype=np.uint8)
+        new_codes[:size] = codes
+        new_ids = np.concatenate([new_ids, np.zeros(capacity - size, np.int64)])
+
+        # swap all at once, searches never see a half-loaded gallery
+        with self.lock:
+            self.embds = new_embds
+            self.codes = new_codes
+            self.ids = new_ids
+            self.metas = list(metas)
+            self.rows = rows
+            self.samples = new_samples
+            self.size = size
+            self.synced_at = time.time()
+
+            # changes made while the snapshot was read
+            journal, self.journal = self.journal or [], None
+            for op, args in journal:
+                if op == "add":
+                    self.add(*args)
+                else:
+                    self.remove(*args)
+
+        log.info(f"Gallery loaded with {self.size} faces ({len(journal)} replayed)")
+
+    def add(
+        self,
+        face_id: int,
+        name: str,
+        embd: List[float],
+        created_at: Optional[datetime] = None,
+        updated_at: Optional[datetime] = None,
+        samples: Optional[np.ndarray] = None,
+    ) -> None:
+        """Add (or replace) a single face, with its sample embeddings if searched."""
+        embd = l2_normalize(embd)
+        code = pack_bits(embd)[: self.code_size]
+        meta = (name, created_at, updated_at)
+        with self.lock:
+            if self.journal is not None:
+                self.journal.append(
+                    ("add", (face_id, name, embd, created_at, updated_at, samples))
+                )
+            if samples is not None:
+                self.samples[face_id] = self.normalize_samples(samples)
+            if face_id in self.rows:
+                row = self.rows[face_id]
+                self.embds[row] = embd
+                self.codes[row] = code
+                self.metas[row] = meta
+                return
+
+            # grow by doubling
+            if self.size == len(self.embds):
+                capacity = max(2 * len(self.embds), 1)
+                embds = np.zeros((capacity, self.dim), dtype=self.dtype)
+                embds[: self.size] = self.embds[: self.size]
+                codes = np.zeros((capacity, self.code_size), dtype=np.uint8)
+                codes[: self.size] = self.codes[: self.size]
+                ids = np.zeros((capacity,), dtype=np.int64)
+                ids[: self.size] = self.ids[: self.size]
+                self.embds, self.codes, self.ids = embds, codes, ids
+
+            self.embds[self.size] = embd
+            self.codes[self.size] = code
+            self.ids[self.size] = face_id
+            self.metas.append(meta)
+            self.rows[face_id] = self.size
+            self.size += 1
+
+    def remove(self, face_id: int) -> bool:
+        """Remove a single face. Return False if not found."""
+        with self.lock:
+            if self.journal is not None:
+                self.journal.append(("remove", (face_id,)))
+            row = self.rows.pop(face_id, None)
+            self.samples.pop(face_id, None)
+            if row is None:
+                return False
+
+            # move the last row into the hole
+            last = self.size - 1
+            if row != last:
+                self.embds[row] = self.embds[last]
+                self.codes[row] = self.codes[last]
+                self.ids[row] = self.ids[last]
+                self.metas[row] = self.metas[last]
+                self.rows[int(self.ids[row])] = row
+            self.metas.pop()
+            self.size -= 1
+
+            return True
+
+    def get_meta(self, row: int) -> Tuple[str, datetime, datetime]:
+        """Get (name, created_at, updated_at) of a gallery row."""
+        return self.metas[row]
+
+    def get_samples(self, row: int) -> Optional[np.ndarray]:
+        """Get the sample embeddings of a gallery row, None if not loaded."""
+        return self.samples.get(int(self.ids[row]))
+
+    def normalize_samples(self, samples: np.ndarray) -> np.ndarray:
+        """Normalized sample embeddings (n, dim), in the storage dtype."""
+        samples = l2_normalize(np.asarray(samples).reshape(-1, self.dim))
+
+        return samples.astype(self.dtype)
+
+    def refresh(self) -> None:
+        """Pick up changes made by other processes (no-op for a local gallery)."""
+
+    def is_stale(self, max_age: float) -> bool:
+        """Whether the last full sync from the database is older than `max_age`."""
+        return time.time() - self.synced_at >= max_age
+
+    def search(
+        self,
+        embds: List[List[float]],
+        distance: float,
+        k: int = 1,
+        method: Literal["cosine", "ip", "l2"] = "ip",
+    ) -> List[List[dict]]:
+        """
+        Search the `k` nearest faces of every embedding. Returns one list of
+        matches per embedding, closest first, keeping only matches under
+        `distance` (same layout as the database query). Embeddings are
+        normalized, so "cosine" and "ip" distances are both 1 - dot product,
+        and "l2" is sqrt(2 * (1 - dot product)).
+        """
+        results: List[List[dict]] = [[] for _ in range(len(embds))]
+        if len(embds) == 0:
+            return results
+
+        queries = l2_normalize(np.asarray(embds).reshape(-1, self.dim))
+        with self.lock:
+            if self.size == 0:
+                return results
+            if self.search_samples:
+                candidates = min(k * self.rerank_factor, self.size)
+                top, top_dists = self.nearest(queries, candidates)
+                top, top_dists = self.rerank_samples(queries, top, top_dists, k)
+            else:
+                top, top_dists = self.nearest(queries, min(k, self.size))
+            if method == "l2":
+                top_dists = np.sqrt(np.maximum(2.0 * top_dists, 0.0))
+
+            for i in range(len(queries)):
+                for row, dist in zip(top[i], top_dists[i]):
+                    if dist >= distance:
+                        break
+                    name, created_at, updated_at = self.get_meta(row)
+                    results[i].append(
+                        {
+                            "id": int(self.ids[row]),
+                            "name": name,
+                            "distance": float(dist),
+                            "created_at": created_at,
+                            "updated_at": updated_at,
+                        }
+                    )
+
+        return results
+
+    def rerank_samples(
+        self, queries: np.ndarray, top: np.ndarray, top_dists: np.ndarray, k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Re-rank candidate rows (q, c) by the distance to their closest sample
+        (the centroid distance if no samples). Returns the `k` best (q, k).
+        """
+        dists = top_dists.copy()
+        for i, query in enumerate(queries):
+            for j, row in enumerate(top[i]):
+                samples = self.get_samples(row)
+                if samples is not None and len(samples):
+                    dists[i, j] = 1.0 - float(np.max(samples @ query))
+        order = np.argsort(dists, axis=1, kind="stable")[:, :k]
+
+        return (
+            np.take_along_axis(top, order, axis=1),
+            np.take_along_axis(dists, order, axis=1),
+        )
+
+    def nearest(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows and cosine distances (q, k) of the nearest faces, closest first."""
+        rows = None
+        if self.code_size and k * self.rerank_factor < self.size:
+            # coarse hamming candidates, re-ranked by cosine distance
+            candidates = k * self.rerank_factor
+            coarse = hamming_distances(pack_bits(queries), self.codes[: self.size])
+            rows = np.argpartition(coarse, candidates - 1, axis=1)[:, :candidates]
+            dists = 1.0 - np.einsum(
+                "qd,qcd->qc", queries, self.embds[rows].astype(np.float32)
+            )
+        elif self.dtype == np.float32:
+            dists = 1.0 - queries @ self.embds[: self.size].T  # (q, n)
+        else:
+            # float16 to float32 by chunks, never the whole matrix at once
+            dists = np.empty((len(queries), self.size), dtype=np.float32)
+            for start in range(0, self.size, 8192):
+                block = self.embds[start : min(start + 8192, self.size)]
+                block = block.astype(np.float32)
+                dists[:, start : start + len(block)] = 1.0 - queries @ block.T
+
+        # top-k per query, then sort the k candidates
+        if k < dists.shape[1]:
+            top = np.argpartition(dists, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(dists.shape[1]), (len(queries), 1))
+        top_dists = np.take_along_axis(dists, top, axis=1)
+        order = np.argsort(top_dists, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_dists = np.take_along_axis(top_dists, order, axis=1)
+        if rows is not None:
+            top = np.take_along_axis(rows, top, axis=1)
+
+        return top, top_dists
+
+
+class SharedFrGallery(FrGallery):
+    """
+    Face recognition gallery shared across processes (gunicorn workers).
+
+    Each generation of the gallery is a directory of `.npy` files that every
+    worker maps read-only, so the embedding matrix lives once in the page
+    cache. A new generation is written next to the current one and published
+    by atomically replacing the `CURRENT` file (holding the generation
+    counter); workers remap when the counter changes. Writers are serialized
+    with an exclusive file lock.
+
+    Local registrations and deletions go to a small in-process overlay that
+    is searched together with the mapped base, and are merged into a new
+    generation at most every `flush_interval` seconds. A sync from the
+    database holds the file lock from `begin_sync` to `load`, so flushes of
+    changes made meanwhile wait for the new generation instead of being
+    overwritten by the snapshot.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        dim: int = 512,
+        flush_interval: float = 5.0,
+        quantization: Literal["none", "halfvec", "bit"] = "none",
+        rerank_factor: int = 4,
+        search_samples: bool = False,
+    ) -> None:
+        """Initialize shared face recognition gallery."""
+        super().__init__(dim, 1, quantization, rerank_factor, search_samples)
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.generation = -1
+        self.flushed_at = 0.0
+        self.sync_lock: Optional[TextIO] = None
+
+        # pending local changes
+        self.overlay = FrGallery(
+            dim,
+            quantization=quantization,
+            rerank_factor=rerank_factor,
+            search_samples=search_samples,
+        )
+        self.removed: Set[int] = set()
+        self.version = 0
+        self.changed: Dict[int, int] = {}
+        self.names = np.zeros((0,), dtype=np.uint8)
+        self.name_offsets = np.zeros((1,), dtype=np.int64)
+        self.created_at = np.zeros((0,), dtype="datetime64[us]")
+        self.updated_at = np.zeros((0,), dtype="datetime64[us]")
+        self.sample_embds = np.zeros((0, dim), dtype=self.dtype)
+        self.sample_offsets = np.zeros((1,), dtype=np.int64)
+
+    @contextmanager
+    def file_lock(self, blocking: bool = True) -> Iterator[bool]:
+        """
+        Exclusive lock between writer processes (and between syncs and flushes
+        of one process). Yields False if not `blocking` and the lock is held.
+        """
+        with open(self.path / "LOCK", "w") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def begin_sync(self, max_age: Optional[float] = None) -> bool:
+        """
+        Take the file lock until the snapshot is published (or `end_sync`).
+        Workers waiting on a sync map its generation once they get the lock,
+        and return False (nothing to load) if it is no longer stale.
+        """
+        sync_lock = open(self.path / "LOCK", "w")
+        fcntl.flock(sync_lock, fcntl.LOCK_EX)
+        self.sync_lock = sync_lock
+        stale = False
+        try:
+            self.remap()
+            stale = max_age is None or self.is_stale(max_age)
+        finally:
+            if not stale:
+                self.end_sync()
+
+        return stale
+
+    def end_sync(self) -> None:
+        """Release the file lock taken by `begin_sync`."""
+        sync_lock, self.sync_lock = self.sync_lock, None
+        if sync_lock is not None:
+            fcntl.flock(sync_lock, fcntl.LOCK_UN)
+            sync_lock.close()
+
+    def read_current(self) -> Optional[dict]:
+        """Read the published generation info, None if nothing is published."""
+        try:
+            with open(self.path / "CURRENT") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def load(
+        self,
+        ids: List[int],
+        metas: List[Tuple[str, datetime, datetime]],
+        embds: np.ndarray,
+        samples: Optional[List[np.ndarray]] = None,
+    ) -> None:
+        """
+        Publish a full gallery (e.g. a sync from the database) to all workers,
+        releasing the file lock of `begin_sync` if held.
+        """
+        embds = l2_normalize(np.asarray(embds).reshape(-1, self.dim))
+        if samples is not None:
+            samples = [self.normalize_samples(embd) for embd in samples]
+        generation = dict(
+            ids=np.asarray(ids, dtype=np.int64),
+            names=[meta[0] for meta in metas],
+            created_at=[meta[1] for meta in metas],
+            updated_at=[meta[2] for meta in metas],
+            embds=embds,
+            synced_at=time.time(),
+            samples=samples,
+        )
+        if self.sync_lock is not None:
+            try:
+                self.publish(**generation)
+            finally:
+                self.end_sync()
+        else:
+            with self.file_lock():
+                self.publish(**generation)
+        self.remap()
+
+        log.info(f"Shared gallery published with {self.size} faces")
+
+    def publish(
+        self,
+        ids: np.ndarray,
+        names: List[str],
+        created_at: List[datetime],
+        updated_at: List[datetime],
+        embds: np.ndarray,
+        synced_at: float,
+        samples: Optional[List[Optional[np.ndarray]]] = None,
+    ) -> None:
+        """Write a new generation and make it current. Call with `file_lock`."""
+        current = self.read_current()
+        generation = current["generation"] + 1 if current else 0
+
+        # rows are sorted by id, for membership checks without a dict
+        order = np.argsort(ids, kind="stable")
+        encoded = [names[i].encode() for i in order]
+        offsets = np.zeros((len(encoded) + 1,), dtype=np.int64)
+        np.cumsum([len(name) for name in encoded], out=offsets[1:])
+
+        tmp_dir = Path(tempfile.mkdtemp(prefix=".tmp-", dir=self.path))
+        embds = np.ascontiguousarray(embds[order], dtype=self.dtype)
+        np.save(tmp_dir / "embds.npy", embds)
+        np.save(tmp_dir / "codes.npy", pack_bits(embds)[:, : self.code_size])
+        np.save(tmp_dir / "ids.npy", ids[order])
+        np.save(tmp_dir / "names.npy", np.frombuffer(b"".join(encoded), np.uint8))
+        np.save(tmp_dir / "name_offsets.npy", offsets)
+
+        # samples of all faces, concatenated in row order
+        empty = np.zeros((0, self.dim), dtype=self.dtype)
+        samples = [samples[i] if samples else None for i in order]
+        samples = [empty if embd is None else embd for embd in samples]
+        sample_offsets = np.zeros((len(samples) + 1,), dtype=np.int64)
+        np.cumsum([len(embd) for embd in samples], out=sample_offsets[1:])
+        sample_embds = np.concatenate([empty, *samples]).astype(self.dtype)
+        np.save(tmp_dir / "sample_embds.npy", sample_embds)
+        np.save(tmp_dir / "sample_offsets.npy", sample_offsets)
+        for key, values in (("created_at", created_at), ("updated_at", updated_at)):
+            values = np.array(
+                [values[i] or np.datetime64("NaT") for i in order],
+                dtype="datetime64[us]",
+            )
+            np.save(tmp_dir / f"{key}.npy", values)
+        os.rename(tmp_dir, self.path / f"gen-{generation:09d}")
+
+        # atomic swap of the generation counter
+        tmp_current = self.path / "CURRENT.tmp"
+        with open(tmp_current, "w") as f:
+            json.dump({"generation": generation, "synced_at": synced_at}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_current, self.path / "CURRENT")
+
+        # mapped files of old generations stay valid until unmapped
+        for old in self.path.glob("gen-*"):
+            if int(old.name[4:]) < generation - 1:
+                shutil.rmtree(old, ignore_errors=True)
+
+    def remap(self) -> None:
+        """Map the current generation if it changed."""
+        current = self.read_current()
+        if current is None or current["generation"] == self.generation:
+            return
+
+        gen_dir = self.path / f"gen-{current['generation']:09d}"
+        arrays = {
+            key: np.load(gen_dir / f"{key}.npy", mmap_mode="r")
+            for key in (
+                "embds",
+                "ids",
+                "names",
+                "name_offsets",
+                "created_at",
+                "updated_at",
+            )
+        }
+        # generations published without (or with other) quantization
+        codes_path = gen_dir / "codes.npy"
+        codes = np.load(codes_path, mmap_mode="r") if codes_path.exists() else None
+        if codes is None or codes.shape[1] != self.code_size:
+            codes = pack_bits(arrays["embds"])[:, : self.code_size]
+        arrays["codes"] = codes
+        for key, empty in (
+            ("sample_embds", np.zeros((0, self.dim), dtype=self.dtype)),
+            ("sample_offsets", np.zeros((len(arrays["ids"]) + 1,), dtype=np.int64)),
+        ):
+            key_path = gen_dir / f"{key}.npy"
+            arrays[key] = (
+                np.load(key_path, mmap_mode="r") if key_path.exists() else empty
+            )
+
+        with self.lock:
+            self.embds = arrays["embds"]
+            self.codes = arrays["codes"]
+            self.ids = arrays["ids"]
+            self.names = arrays["names"]
+            self.name_offsets = arrays["name_offsets"]
+            self.created_at = arrays["created_at"]
+            self.updated_at = arrays["updated_at"]
+            self.sample_embds = arrays["sample_embds"]
+            self.sample_offsets = arrays["sample_offsets"]
+            self.size = len(self.ids)
+            self.generation = current["generation"]
+            self.synced_at = current["synced_at"]
+
+        log.info(
+            f"Shared gallery mapped generation {self.generation} ({self.size} faces)"
+        )
+
+    def refresh(self) -> None:
+        """Flush pending local changes (throttled) and map the newest generation."""
+        if time.time() - self.flushed_at >= self.flush_interval:
+            self.flush()
+        self.remap()
+
+    def flush(self) -> None:
+        """
+        Merge pending local changes into a new generation. Skipped (retried on
+        the next refresh) while the file lock is held, e.g. by a sync.
+        """
+        with self.lock:
+            version = self.version
+            removed = set(self.removed)
+            size = len(self.overlay)
+            adds = (
+                self.overlay.ids[:size].copy(),
+                self.overlay.embds[:size].copy(),
+                [self.overlay.get_meta(row) for row in range(size)],
+                [self.overlay.get_samples(row) for row in range(size)],
+            )
+        if not removed and size == 0:
+            self.flushed_at = time.time()
+            return
+
+        with self.file_lock(blocking=False) as locked:
+            if not locked:
+                log.debug("Shared gallery flush deferred, the gallery is locked")
+                return
+
+            # other workers may have published meanwhile
+            self.remap()
+            add_ids, add_embds, add_metas, add_samples = adds
+            drop = np.fromiter(removed, dtype=np.int64, count=len(removed))
+            keep = ~np.isin(self.ids, np.concatenate([drop, add_ids]))
+            rows = np.flatnonzero(keep)
+            self.publish(
+                ids=np.concatenate([np.asarray(self.ids)[rows], add_ids]),
+                names=[self.get_meta(row)[0] for row in rows]
+                + [meta[0] for meta in add_metas],
+                created_at=[self.get_meta(row)[1] for row in rows]
+                + [meta[1] for meta in add_metas],
+                updated_at=[self.get_meta(row)[2] for row in rows]
+                + [meta[2] for meta in add_metas],
+                embds=np.concatenate([np.asarray(self.embds)[rows], add_embds]),
+                synced_at=self.synced_at,
+                samples=[self.get_samples(row) for row in rows] + add_samples,
+            )
+            self.remap()
+
+        # the new generation holds the flushed changes, not the ones made since
+        with self.lock:
+            for face_id in add_ids:
+                if self.changed.get(int(face_id), 0) <= version:
+                    self.overlay.remove(int(face_id))
+            self.removed -= {
+                face_id
+                for face_id in removed
+                if self.changed.get(face_id, 0) <= version
+            }
+            self.changed = {
+                face_id: changed
+                for face_id, changed in self.changed.items()
+                if changed > version
+            }
+        self.flushed_at = time.time()
+
+        log.info(f"Shared gallery flushed {size} additions, {len(removed)} removals")
+
+    def add(
+        self,
+        face_id: int,
+        name: str,
+        embd: List[float],
+        created_at: Optional[datetime] = None,
+        updated_at: Optional[datetime] = None,
+        samples: Optional[np.ndarray] = None,
+    ) -> None:
+        """Add (or replace) a single face in the local overlay."""
+        with self.lock:
+            self.overlay.add(face_id, name, embd, created_at, updated_at, samples)
+            self.removed.discard(face_id)
+            self.version += 1
+            self.changed[face_id] = self.version
+
+    def remove(self, face_id: int) -> bool:
+        """Remove a single face. Return False if not found."""
+        with self.lock:
+            found = self.overlay.remove(face_id)
+            row = np.searchsorted(self.ids, face_id)
+            if row < self.size and self.ids[row] == face_id:
+                self.removed.add(face_id)
+                found = True
+            self.version += 1
+            self.changed[face_id] = self.version
+
+            return found
+
+    def get_meta(self, row: int) -> Tuple[str, datetime, datetime]:
+        """Get (name, created_at, updated_at) of a mapped row."""
+        name = bytes(self.names[self.name_offsets[row] : self.name_offsets[row + 1]])
+        created_at, updated_at = self.created_at[row], self.updated_at[row]
+
+        return (
+            name.decode(),
+            None if np.isnat(created_at) else created_at.item(),
+            None if np.isnat(updated_at) else updated_at.item(),
+        )
+
+    def get_samples(self, row: int) -> Optional[np.ndarray]:
+        """Get the sample embeddings of a mapped row, None if not published."""
+        start, end = self.sample_offsets[row], self.sample_offsets[row + 1]
+
+        return self.sample_embds[start:end] if end > start else None
+
+    def search(
+        self,
+        embds: List[List[float]],
+        distance: float,
+        k: int = 1,
+        method: Literal["cosine", "ip", "l2"] = "ip",
+    ) -> List[List[dict]]:
+        """Search the mapped base and the local overlay, see `FrGallery.search`."""
+        with self.lock:
+            removed = set(self.removed)
+            overlay_ids = set(self.overlay.rows)
+
+        # over-fetch to make up for hidden rows
+        base = super().search(
+            embds, distance, k + len(removed) + len(overlay_ids), method
+        )
+        local = self.overlay.search(embds, distance, k, method)
+
+        results: List[List[dict]] = []
+        for base_matches, local_matches in zip(base, local):
+            matches = [
+                m
+                for m in base_matches
+                if m["id"] not in removed and m["id"] not in overlay_ids
+            ]
+            matches = sorted(matches + local_matches, key=lambda m: m["distance"])
+            results.append(matches[:k])
+
+        return results
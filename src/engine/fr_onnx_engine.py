@@ -4,14 +4,17 @@ import rootutils
 
 ROOT = rootutils.autosetup()
 
-from typing import List
+from typing import List, Optional, Union
 
 import numpy as np
 
 from src.engine.arcface_onnx_engine import ArcfaceOnnxEngine
+from src.engine.landmark_onnx_engine import LandmarkOnnxEngine
 from src.engine.yolo_onnx_engine import YoloxOnnxEngine
 from src.schema.fr_schema import FrResultSchema
-from src.schema.yolo_schema import YoloResultSchema
+from src.schema.onnx_schema import OnnxSessionSchema
+from src.schema.yolo_schema import YoloResult
+from src.utils.image import EncodedImage
 from src.utils.logger import get_logger
 
 log = get_logger()
@@ -26,12 +29,23 @@ class FrOnnxEngine:
         rec_engine_path: str,
         det_max_end2end: int = 100,
         provider: str = "cpu",
+        io_binding: bool = False,
+        det_session: Optional[OnnxSessionSchema] = None,
+        rec_session: Optional[OnnxSessionSchema] = None,
+        lmk_engine_path: Optional[str] = None,
+        lmk_session: Optional[OnnxSessionSchema] = None,
     ) -> None:
         """Initialize face recognition ONNX engine."""
         self.det_engine_path = det_engine_path
         self.rec_engine_path = rec_engine_path
         self.det_max_end2end = det_max_end2end
         self.provider = provider
+        self.io_binding = io_binding
+        self.det_session = det_session
+        self.rec_session = rec_session
+        self.lmk_engine_path = lmk_engine_path
+        self.lmk_session = lmk_session
+        self.lmk_engine: Optional[LandmarkOnnxEngine] = None
 
     def setup(self) -> None:
         """Setup face recognition ONNX engine."""
@@ -43,56 +57,116 @@ class FrOnnxEngine:
             categories=["face"],
             provider=self.provider,
             max_det_end2end=self.det_max_end2end,
+            io_binding=self.io_binding,
+            session=self.det_session,
         )
         self.det_engine.setup()
 
         # setup face recognition engine
         self.rec_engine = ArcfaceOnnxEngine(
-            engine_path=self.rec_engine_path, provider=self.provider
+            engine_path=self.rec_engine_path,
+            provider=self.provider,
+            io_binding=self.io_binding,
+            session=self.rec_session,
         )
         self.rec_engine.setup()
 
+        # setup face landmark engine (optional alignment)
+        if self.lmk_engine_path:
+            self.lmk_engine = LandmarkOnnxEngine(
+                engine_path=self.lmk_engine_path,
+                provider=self.provider,
+                io_binding=self.io_binding,
+                session=self.lmk_session,
+            )
+            self.lmk_engine.setup()
+
         log.info(f"Face recognition ONNX engine setup complete")
 
     def predict(
-        self, imgs: List[np.ndarray], det_conf: float = 0.25, det_nms: float = 0.45
+        self,
+        imgs: List[Union[np.ndarray, EncodedImage]],
+        det_conf: float = 0.25,
+        det_nms: float = 0.45,
     ) -> List[FrResultSchema]:
-        """Predict embeddings from image(s)."""
+        """
+        Predict embeddings from image(s). Encoded images are detected at their
+        reduced resolution and cropped at the resolution the faces need.
+        """
         # detect faces
         det_results = self.detect_faces(imgs, det_conf, det_nms)
 
-        # get embeddings
-        results: List[FrResultSchema] = []
+        # get embeddings of all faces of all images in a single call
         batch_faces = self.preprocess_rec(det_results, imgs)
-        for faces, dets in zip(batch_faces, det_results):
+        faces = [face for img_faces in batch_faces for face in img_faces]
+        embds = self.get_embds(faces) if faces else None
+
+        # scatter embeddings back to their images
+        results: List[FrResultSchema] = []
+        start = 0
+        for dets in det_results:
             if len(dets.boxes) == 0:
                 results.append(FrResultSchema())
                 continue
 
-            embds = self.get_embds(faces)
-            result = FrResultSchema(
-                boxes=dets.boxes,
-                scores=dets.scores,
-                categories=dets.categories,
-                embeddings=embds,
-            )
+            end = start + len(dets.boxes)
+            result = FrResultSchema(**dets.to_dict(), embeddings=embds[start:end])
+            start = end
 
             results.append(result)
 
         return results
 
     def detect_faces(
-        self, imgs: List[np.ndarray], conf: float = 0.25, nms: float = 0.45
-    ) -> List[YoloResultSchema]:
-        """Detect faces from image(s)."""
-        return self.det_engine.predict(imgs, conf, nms)
+        self,
+        imgs: List[Union[np.ndarray, EncodedImage]],
+        conf: float = 0.25,
+        nms: float = 0.45,
+    ) -> List[YoloResult]:
+        """Detect faces from image(s). Boxes are in full resolution."""
+        det_imgs = [img.img if isinstance(img, EncodedImage) else img for img in imgs]
+        results = self.det_engine.predict(det_imgs, conf, nms)
+        for img, dets in zip(imgs, results):
+            if isinstance(img, EncodedImage):
+                dets.boxes = img.scale_boxes(dets.boxes)
 
-    def get_embds(self, imgs: List[np.ndarray]) -> List[np.ndarray]:
-        """Get embeddings from image(s)."""
-        return self.rec_engine.predict(imgs)
+        return results
+
+    def embed_faces(
+        self, img: Union[np.ndarray, EncodedImage], boxes: List[List[int]]
+    ) -> List[List[float]]:
+        """Get embeddings of the given face boxes of a single image."""
+        if len(boxes) == 0:
+            return []
+
+        return self.get_embds(self.crop_faces(img, boxes)).tolist()
+
+    def crop_faces(
+        self, img: Union[np.ndarray, EncodedImage], boxes: List[List[int]]
+    ) -> List[np.ndarray]:
+        """Crop face boxes of a single image."""
+        if isinstance(img, EncodedImage):
+            return img.crop_faces(boxes, min_face=max(self.rec_engine.img_shape))
+
+        return [img[box[1] : box[3], box[0] : box[2]] for box in boxes]
+
+    def get_embds(self, imgs: List[np.ndarray]) -> np.ndarray:
+        """
+        Get L2-normalized embeddings from image(s), aligned by landmarks if
+        enabled. Normalized once here, the inner product is the cosine.
+        """
+        matrices = None
+        if self.lmk_engine is not None:
+            matrices = self.lmk_engine.align(imgs, self.rec_engine.img_shape)
+        embds = np.asarray(self.rec_engine.predict(imgs, matrices), dtype=np.float32)
+        norms = np.linalg.norm(embds, axis=-1, keepdims=True)
+
+        return embds / np.maximum(norms, 1e-12)
 
     def preprocess_rec(
-        self, batch_dets: List[YoloResultSchema], imgs: List[np.ndarray]
+        self,
+        batch_dets: List[YoloResult],
+        imgs: List[Union[np.ndarray, EncodedImage]],
     ):
         """Preprocess faces for recognition."""
         # crop faces
@@ -101,10 +175,6 @@ class FrOnnxEngine:
             if len(dets.boxes) == 0:
                 batch_faces.append([])
                 continue
-            faces: List[np.ndarray] = []
-            for box in dets.boxes:
-                face = imgs[i][box[1] : box[3], box[0] : box[2]]
-                faces.append(face)
-            batch_faces.append(faces)
+            batch_faces.append(self.crop_faces(imgs[i], dets.boxes))
 
         return batch_faces
@@ -0,0 +1,100 @@
+"""Face landmark ONNX engine."""
+
+import rootutils
+
+ROOT = rootutils.autosetup()
+
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from src.engine.onnx_engine import CommonOnnxEngine
+from src.schema.onnx_schema import OnnxSessionSchema
+from src.utils.logger import get_logger
+
+log = get_logger()
+
+# arcface 5-point template (eyes, nose, mouth corners) of a 112x112 face
+ARCFACE_DST = np.array(
+    [
+        [38.2946, 51.6963],
+        [73.5318, 51.5014],
+        [56.0252, 71.7366],
+        [41.5493, 92.3655],
+        [70.7299, 92.2041],
+    ],
+    dtype=np.float32,
+)
+
+
+def estimate_similarity(src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+    """
+    Least squares similarity transforms (rotation, uniform scale, translation)
+    mapping the landmarks `src` (N, K, 2) onto `dst` (K, 2), for all faces at
+    once. Returns affine matrices (N, 2, 3).
+    """
+    src = np.asarray(src, dtype=np.float32)
+    src_mean = src.mean(axis=1, keepdims=True)
+    dst_mean = dst.mean(axis=0, keepdims=True)
+    src_c = src - src_mean
+    dst_c = dst - dst_mean
+
+    norm = np.maximum((src_c**2).sum(axis=(1, 2)), 1e-6)
+    a = (src_c * dst_c).sum(axis=(1, 2)) / norm
+    b = (src_c[..., 0] * dst_c[..., 1] - src_c[..., 1] * dst_c[..., 0]).sum(1) / norm
+
+    matrices = np.empty((len(src), 2, 3), dtype=np.float32)
+    matrices[:, 0, 0], matrices[:, 0, 1] = a, -b
+    matrices[:, 1, 0], matrices[:, 1, 1] = b, a
+    matrices[:, :, 2] = dst_mean[0] - np.einsum(
+        "nij,nj->ni", matrices[:, :, :2], src_mean[:, 0]
+    )
+
+    return matrices
+
+
+class LandmarkOnnxEngine(CommonOnnxEngine):
+    """
+    Face 5-point landmark ONNX engine module.
+
+    The model takes RGB face crops scaled to [0, 1] (N, 3, H, W) and outputs
+    5 landmarks per face (N, 10) or (N, 5, 2), in coordinates relative to the
+    crop size ([0, 1]).
+    """
+
+    def __init__(
+        self,
+        engine_path: str,
+        provider: str = "cpu",
+        io_binding: bool = False,
+        session: Optional[OnnxSessionSchema] = None,
+    ) -> None:
+        """Initialize landmark ONNX engine."""
+        super().__init__(engine_path, provider, io_binding, session)
+
+    def predict(self, imgs: List[np.ndarray]) -> np.ndarray:
+        """Predict landmarks (N, 5, 2) of face crops, in crop pixels."""
+        inputs = self.preprocess_imgs(imgs)
+        outputs = self.run(inputs)
+        sizes = np.array([img.shape[1::-1] for img in imgs], dtype=np.float32)
+
+        return outputs[0].reshape(len(imgs), 5, 2) * sizes[:, None, :]
+
+    def align(self, imgs: List[np.ndarray], dst_shape: Tuple[int, int]) -> np.ndarray:
+        """Affine matrices (N, 2, 3) aligning face crops to a `dst_shape` face."""
+        dst_h, dst_w = dst_shape
+        dst = ARCFACE_DST * np.array([dst_w / 112.0, dst_h / 112.0], np.float32)
+
+        return estimate_similarity(self.predict(imgs), dst)
+
+    def preprocess_imgs(self, imgs: List[np.ndarray]) -> np.ndarray:
+        """Preprocess images (faces) into a reused NCHW float32 buffer."""
+        dst_h, dst_w = self.img_shape
+        inputs = self.get_buffer("input", (len(imgs), 3, dst_h, dst_w))
+        for i, img in enumerate(imgs):
+            img = cv2.resize(img, (dst_w, dst_h))
+            np.copyto(inputs[i], img.transpose((2, 0, 1)), casting="unsafe")
+        inputs /= 255.0
+
+        return inputs
@@ -4,37 +4,192 @@ import rootutils
 
 ROOT = rootutils.autosetup()
 
+import os
+import threading
 from pathlib import Path
-from typing import List, Union
+from typing import List, Optional, Tuple, Union
 
+import numpy as np
 import onnxruntime as ort
 
-from src.schema.onnx_schema import OnnxMetadataSchema
+from src.schema.onnx_schema import OnnxMetadataSchema, OnnxSessionSchema
 from src.utils.logger import get_logger
 
 log = get_logger()
 
+ONNX_DTYPES = {
+    "tensor(float)": np.float32,
+    "tensor(float16)": np.float16,
+    "tensor(double)": np.float64,
+    "tensor(int32)": np.int32,
+    "tensor(int64)": np.int64,
+    "tensor(bool)": np.bool_,
+}
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def tune_session_threads(
+    session: OnnxSessionSchema, workers: int = 1, concurrency: int = 1
+) -> OnnxSessionSchema:
+    """
+    Fill the auto (0 / None) thread options from the CPU count, the number of
+    server worker processes and the number of concurrent runs per process, so
+    that all sessions together do not oversubscribe the cores.
+    """
+    try:
+        num_cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        num_cpus = os.cpu_count() or 1
+    runs = max(workers, 1) * max(concurrency, 1)
+    update = {}
+    if session.intra_op_num_threads == 0:
+        update["intra_op_num_threads"] = max(1, num_cpus // runs)
+    if session.inter_op_num_threads == 0:
+        update["inter_op_num_threads"] = 1
+    if session.allow_spinning is None:
+        # spinning threads burn cores other sessions need
+        update["allow_spinning"] = runs == 1
+    tuned = session.model_copy(update=update)
+    log.info(
+        f"ONNX session threads: intra {tuned.intra_op_num_threads}, "
+        f"inter {tuned.inter_op_num_threads}, spinning {tuned.allow_spinning} "
+        f"({num_cpus} cpus, {runs} concurrent runs)"
+    )
+
+    return tuned
+
 
 class CommonOnnxEngine:
     """Common ONNX runtime engine module."""
 
-    def __init__(self, engine_path: str, provider: str = "cpu") -> None:
+    def __init__(
+        self,
+        engine_path: str,
+        provider: str = "cpu",
+        io_binding: bool = False,
+        session: Optional[OnnxSessionSchema] = None,
+    ) -> None:
         """Initialize ONNX runtime common engine."""
         self.engine_path = Path(engine_path)
         self.provider = provider
         self.provider = self.check_providers(provider)
+        self.io_binding = io_binding
+        self.session = session or OnnxSessionSchema()
+        self.buffers = threading.local()
 
     def setup(self) -> None:
         """Setup ONNX runtime engine."""
         log.info(f"Setup ONNX engine...")
+        engine_path, options = self.get_session_options()
         self.engine = ort.InferenceSession(
-            str(self.engine_path), providers=self.provider
+            str(engine_path), sess_options=options, providers=self.provider
         )
         self.metadata = self.get_metadata()
         self.img_shape = self.metadata[0].input_shape[2:]
+        self.outputs = self.engine.get_outputs()
 
         log.info(f"ONNX engine is ready!")
 
+    def get_session_options(self) -> Tuple[Path, ort.SessionOptions]:
+        """Build session options. Returns the model path to load and options."""
+        options = ort.SessionOptions()
+        if self.session.intra_op_num_threads > 0:
+            options.intra_op_num_threads = self.session.intra_op_num_threads
+        if self.session.inter_op_num_threads > 0:
+            options.inter_op_num_threads = self.session.inter_op_num_threads
+        options.execution_mode = (
+            ort.ExecutionMode.ORT_PARALLEL
+            if self.session.execution_mode == "parallel"
+            else ort.ExecutionMode.ORT_SEQUENTIAL
+        )
+        options.enable_mem_pattern = self.session.enable_mem_pattern
+        options.enable_cpu_mem_arena = self.session.enable_cpu_mem_arena
+        if self.session.allow_spinning is not None:
+            spinning = "1" if self.session.allow_spinning else "0"
+            options.add_session_config_entry(
+                "session.intra_op.allow_spinning", spinning
+            )
+            options.add_session_config_entry(
+                "session.inter_op.allow_spinning", spinning
+            )
+        options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[
+            self.session.graph_optimization_level
+        ]
+
+        # optimized model cache, reused while newer than the source model
+        engine_path = self.engine_path
+        if self.session.optimized_model_filepath:
+            optimized_path = Path(self.session.optimized_model_filepath)
+            if (
+                optimized_path.exists()
+                and optimized_path.stat().st_mtime >= engine_path.stat().st_mtime
+            ):
+                log.info(f"Load optimized ONNX model: {optimized_path}")
+                engine_path = optimized_path
+                options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS["disable"]
+            else:
+                optimized_path.parent.mkdir(parents=True, exist_ok=True)
+                options.optimized_model_filepath = str(optimized_path)
+
+        return engine_path, options
+
+    def run(self, inputs: np.ndarray) -> List[np.ndarray]:
+        """
+        Run the engine on a single input tensor.
+
+        With `io_binding`, input and outputs are bound to per-thread buffers
+        reused across calls, so the returned arrays are only valid until the
+        next `run` on the same thread.
+        """
+        if not self.io_binding:
+            return self.engine.run(None, {self.metadata[0].input_name: inputs})
+
+        inputs = np.ascontiguousarray(inputs)
+        cache = self.buffers.__dict__
+        binding = cache.get("io_binding")
+        if binding is None:
+            binding = self.engine.io_binding()
+            cache["io_binding"] = binding
+        binding.bind_cpu_input(self.metadata[0].input_name, inputs)
+
+        outputs: List[np.ndarray] = []
+        for out in self.outputs:
+            # first dim is the batch, others must be static to preallocate
+            shape = [inputs.shape[0], *out.shape[1:]]
+            if not all(isinstance(dim, int) for dim in shape):
+                binding.bind_output(out.name, "cpu")
+                outputs.append(None)
+                continue
+            buffer = self.get_buffer(
+                f"output:{out.name}", tuple(shape), ONNX_DTYPES[out.type]
+            )
+            binding.bind_output(
+                name=out.name,
+                device_type="cpu",
+                device_id=0,
+                element_type=buffer.dtype,
+                shape=buffer.shape,
+                buffer_ptr=buffer.ctypes.data,
+            )
+            outputs.append(buffer)
+        self.engine.run_with_iobinding(binding)
+
+        # outputs allocated by onnx runtime (dynamic shapes)
+        if any(output is None for output in outputs):
+            ort_outputs = binding.copy_outputs_to_cpu()
+            outputs = [
+                ort_output if output is None else output
+                for output, ort_output in zip(outputs, ort_outputs)
+            ]
+
+        return outputs
+
     def get_metadata(self) -> List[OnnxMetadataSchema]:
         """Get model metadata."""
         inputs = self.engine.get_inputs()
@@ -53,6 +208,26 @@ class CommonOnnxEngine:
 
         return result
 
+    def get_buffer(
+        self, name: str, shape: Tuple[int, ...], dtype: np.dtype = np.float32
+    ) -> np.ndarray:
+        """
+        Get a reusable contiguous buffer of `shape`. One buffer per name and
+        thread is kept, grown along the batch axis and sliced to the batch size.
+        """
+        cache = self.buffers.__dict__
+        buffer = cache.get(name)
+        if (
+            buffer is None
+            or buffer.shape[0] < shape[0]
+            or buffer.shape[1:] != tuple(shape[1:])
+            or buffer.dtype != dtype
+        ):
+            buffer = np.empty(shape, dtype=dtype)
+            cache[name] = buffer
+
+        return buffer[: shape[0]]
+
     def check_providers(self, provider: Union[str, list]) -> list:
         """Check available providers. If provider is not available, use CPU instead."""
         assert provider in ["cpu", "gpu"], "Invalid provider"
@@ -4,13 +4,14 @@ import rootutils
 
 ROOT = rootutils.autosetup()
 
-from typing import List
+from typing import List, Optional
 
 import cv2
 import numpy as np
 
 from src.engine.onnx_engine import CommonOnnxEngine
-from src.schema.yolo_schema import YoloE2EResultSchema, YoloResultSchema
+from src.schema.onnx_schema import OnnxSessionSchema
+from src.schema.yolo_schema import YoloResult
 from src.utils.logger import get_logger
 
 log = get_logger()
@@ -25,27 +26,29 @@ class YoloxOnnxEngine(CommonOnnxEngine):
         categories: List[str] = ["face"],
         provider: str = "cpu",
         max_det_end2end: int = 100,
+        io_binding: bool = False,
+        session: Optional[OnnxSessionSchema] = None,
     ) -> None:
         """Initialize YOLO ONNX engine."""
-        super().__init__(engine_path, provider)
+        super().__init__(engine_path, provider, io_binding, session)
         self.categories = categories
         self.max_det_end2end = max_det_end2end
 
     def predict(
         self, imgs: List[np.ndarray], conf: float = 0.25, nms: float = 0.45
-    ) -> List[YoloResultSchema]:
+    ) -> List[YoloResult]:
         """Detect objects from image(s)."""
+        sizes = np.array([img.shape[1::-1] for img in imgs], dtype=np.float32)
         imgs, ratios, pads = self.preprocess_imgs(imgs)
-        outputs = self.engine.run(None, {self.metadata[0].input_name: imgs})
-        results = self.postprocess_end2end(outputs, ratios, pads, conf)
+        outputs = self.run(imgs)
+        results = self.postprocess_end2end(outputs, ratios, pads, sizes, conf)
 
         return results
 
     def preprocess_imgs(self, imgs: List[np.ndarray]):
-        """Preprocess images."""
-        # resize and pad
+        """Preprocess images (letterbox) into a reused NCHW float32 buffer."""
         dst_h, dst_w = self.img_shape
-        resized_imgs = np.ones((len(imgs), dst_h, dst_w, 3), dtype=np.float32) * 114
+        resized_imgs = self.get_buffer("images", (len(imgs), 3, dst_h, dst_w))
         ratios = np.ones((len(imgs)), dtype=np.float32)
         pads = np.ones((len(imgs), 2), dtype=np.float32)
         for i, img in enumerate(imgs):
@@ -54,19 +57,26 @@ class YoloxOnnxEngine(CommonOnnxEngine):
             resized_w, resized_h = int(src_w * ratio), int(src_h * ratio)
             dw, dh = (dst_w - resized_w) / 2, (dst_h - resized_h) / 2
             img = cv2.resize(img, (resized_w, resized_h))
-            top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
-            left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
-            img = cv2.copyMakeBorder(
-                img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=114
+            top, left = int(round(dh - 0.1)), int(round(dw - 0.1))
+            bottom, right = top + resized_h, left + resized_w
+
+            # pad borders only, the image slot is fully overwritten below
+            slot = resized_imgs[i]
+            slot[:, :top] = 114
+            slot[:, bottom:] = 114
+            slot[:, top:bottom, :left] = 114
+            slot[:, top:bottom, right:] = 114
+
+            # uint8 HWC -> float32 CHW in one pass
+            np.copyto(
+                slot[:, top:bottom, left:right],
+                img.transpose((2, 0, 1)),
+                casting="unsafe",
             )
-            resized_imgs[i] = img
 
             pads[i] = np.array([dw, dh], dtype=np.float32)
             ratios[i] = ratio
 
-        # transpose to NCHW
-        resized_imgs = resized_imgs.transpose((0, 3, 1, 2))
-
         return resized_imgs, ratios, pads
 
     def postprocess_end2end(
@@ -74,51 +84,33 @@ class YoloxOnnxEngine(CommonOnnxEngine):
         outputs: List[np.ndarray],
         ratios: np.ndarray,
         pads: np.ndarray,
+        sizes: np.ndarray,
         conf: float = 0.25,
-    ):
-        """Postprocess end2end outputs."""
-        # parse outputs
-        e2e_outputs: List[YoloE2EResultSchema] = []
-        for i in range((outputs[0].shape[0])):  # batch size
-            num_dets = int(outputs[0][i][0])
-            boxes = outputs[1][i][:num_dets]
-            scores = outputs[2][i][:num_dets]
-            classes = outputs[3][i][:num_dets]
-            e2e_outputs.append(
-                YoloE2EResultSchema(
-                    num_dets=num_dets,
-                    boxes=boxes,
-                    scores=scores,
-                    classes=classes,
-                )
-            )
-
-        # scaling and filtering
-        results: List[YoloResultSchema] = []
-        for i, out in enumerate(e2e_outputs):
-            # scale bbox to original image size
-            out.boxes[:, 0::2] -= pads[i][0]
-            out.boxes[:, 1::2] -= pads[i][1]
-            out.boxes /= ratios[i]
-
-            # filter by conf
-            mask = out.scores > conf
-            out.boxes = out.boxes[mask].astype(np.int32)
-            out.scores = out.scores[mask]
-            out.classes = out.classes[mask]
-
-            # filter by class
-            mask = out.classes < len(self.categories)
-            out.boxes = out.boxes[mask]
-            out.scores = out.scores[mask]
-            out.classes = out.classes[mask]
-
-            results.append(
-                YoloResultSchema(
-                    categories=[self.categories[int(i)] for i in out.classes],
-                    scores=out.scores,
-                    boxes=out.boxes,
-                )
-            )
-
-        return results
+    ) -> List[YoloResult]:
+        """
+        Postprocess end2end outputs (num_dets, boxes, scores, classes) of the
+        whole batch at once. Boxes are scaled back to the original image
+        size (w, h) of `sizes` and clipped to it.
+        """
+        num_dets = outputs[0].reshape(-1)
+        boxes, scores, classes = outputs[1], outputs[2], outputs[3].astype(np.int64)
+
+        # filter by detection count, conf and class
+        mask = np.arange(scores.shape[1]) < num_dets[:, None]
+        mask &= scores > conf
+        mask &= (classes >= 0) & (classes < len(self.categories))
+
+        # scale bbox to original image size, clipped to the image
+        boxes = (boxes - np.tile(pads, 2)[:, None]) / ratios[:, None, None]
+        boxes = np.clip(boxes, 0, np.tile(sizes, 2)[:, None]).astype(np.int32)
+
+        # split back into images
+        splits = np.cumsum(mask.sum(axis=1))[:-1]
+        batch_boxes = np.split(boxes[mask], splits)
+        batch_scores = np.split(np.round(scores[mask].astype(np.float64), 2), splits)
+        batch_classes = np.split(classes[mask], splits)
+
+        return [
+            YoloResult(boxes=b, scores=s, classes=c, names=self.categories)
+            for b, s, c in zip(batch_boxes, batch_scores, batch_classes)
+        ]
@@ -0,0 +1,111 @@
+"""Bulk enrollment function."""
+
+import rootutils
+
+ROOT = rootutils.autosetup()
+
+import argparse
+
+from src.schema.configs import Configs, cfg
+from src.utils.logger import get_logger
+
+log = get_logger()
+
+
+def main_enroll(
+    cfg: Configs,
+    source: str,
+    progress: str = None,
+    report: str = None,
+    det_conf: float = 0.25,
+    det_nms: float = 0.45,
+) -> None:
+    """Bulk enroll a directory or zip/tar archive of single-face images."""
+    from src.db.pg_db import PgSyncDb
+    from src.engine.fr_enroller import FrBulkEnroller
+    from src.engine.fr_onnx_engine import FrOnnxEngine
+    from src.engine.onnx_engine import tune_session_threads
+
+    log.info(f"Starting bulk enrollment of {source}")
+
+    # db
+    pg = PgSyncDb(
+        host=cfg.POSTGRES_HOST,
+        port=cfg.POSTGRES_PORT,
+        user=cfg.POSTGRES_USER,
+        password=cfg.POSTGRES_PASSWORD,
+        db=cfg.POSTGRES_DB,
+        index_type=cfg.POSTGRES_INDEX_TYPE,
+        hnsw_m=cfg.POSTGRES_HNSW_M,
+        hnsw_ef_construction=cfg.POSTGRES_HNSW_EF_CONSTRUCTION,
+        ivfflat_lists=cfg.POSTGRES_IVFFLAT_LISTS,
+        quantization=cfg.POSTGRES_INDEX_QUANTIZATION,
+        index_method=cfg.POSTGRES_INDEX_METHOD,
+    )
+    pg.setup()
+    pg.create_all()
+
+    # engine, sessions tuned for the enrollment workers
+    sessions = [cfg.FR_DET_SESSION, cfg.FR_REC_SESSION, cfg.FR_LMK_SESSION]
+    if cfg.FR_SESSION_AUTO_TUNE:
+        sessions = [
+            tune_session_threads(session, 1, cfg.FR_ENROLL_WORKERS)
+            for session in sessions
+        ]
+    engine = FrOnnxEngine(
+        det_engine_path=cfg.FR_DET_ENGINE_PATH,
+        rec_engine_path=cfg.FR_REC_ENGINE_PATH,
+        det_max_end2end=cfg.FR_DET_MAX_END2END,
+        provider=cfg.FR_PROVIDER,
+        io_binding=cfg.FR_IO_BINDING,
+        det_session=sessions[0],
+        rec_session=sessions[1],
+        lmk_engine_path=cfg.FR_LMK_ENGINE_PATH or None,
+        lmk_session=sessions[2],
+    )
+    engine.setup()
+
+    enroller = FrBulkEnroller(
+        engine=engine,
+        pg=pg,
+        batch_size=cfg.FR_ENROLL_BATCH_SIZE,
+        workers=cfg.FR_ENROLL_WORKERS,
+        commit_size=cfg.FR_ENROLL_COMMIT_SIZE,
+        det_side=(max(engine.det_engine.img_shape) if cfg.FR_REDUCED_DECODE else None),
+    )
+    result = enroller.enroll(
+        source,
+        det_conf=det_conf,
+        det_nms=det_nms,
+        progress_path=progress,
+        report_path=report,
+    )
+
+    # ivfflat indexes are deferred until the faces are loaded
+    pg.create_vector_indexes()
+
+    log.info(
+        f"Enrolled {result.enrolled} faces, rejected {len(result.rejected)}, "
+        f"skipped {result.skipped} already processed"
+    )
+
+
+if __name__ == "__main__":
+    """Bulk enrollment function."""
+
+    parser = argparse.ArgumentParser(description="Bulk enroll faces")
+    parser.add_argument("source", help="directory or zip/tar archive of images")
+    parser.add_argument("--progress", default=None, help="resumable progress file")
+    parser.add_argument("--report", default=None, help="rejected images report")
+    parser.add_argument("--det-conf", type=float, default=0.25)
+    parser.add_argument("--det-nms", type=float, default=0.45)
+    args = parser.parse_args()
+
+    main_enroll(
+        cfg,
+        source=args.source,
+        progress=args.progress,
+        report=args.report,
+        det_conf=args.det_conf,
+        det_nms=args.det_nms,
+    )
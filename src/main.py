@@ -14,9 +14,10 @@ def main_api(cfg: Configs) -> None:
     """Main API function."""
     from fastapi import FastAPI
 
-    from src.api.base_api import BaseApi
+    from src.api.base_api import busy_exception_handler
     from src.api.fr_api import FrApi
     from src.api.server import GunicornServer, UvicornServer
+    from src.utils.executor import ExecutorBusyError
 
     log.info(f"Starting API server on {cfg.API_HOST}:{cfg.API_PORT}")
 
@@ -26,14 +27,13 @@ def main_api(cfg: Configs) -> None:
         version="1.0.0",
         docs_url="/",
     )
+    app.add_exception_handler(ExecutorBusyError, busy_exception_handler)
 
-    # base api
-    base_api = BaseApi(cfg)
-    app.include_router(base_api.router)
-
-    # fr api
+    # fr api (a base api, owning the db pool and the engine executor)
     fr_api = FrApi(cfg)
-    app.include_router(fr_api.router, prefix="/api/v1/engine", tags=["face-recognition"])
+    app.include_router(
+        fr_api.router, prefix="/api/v1/engine", tags=["face-recognition"]
+    )
 
     # server
     if cfg.SERVER == "gunicorn":
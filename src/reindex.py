@@ -0,0 +1,42 @@
+"""Vector index rebuild function."""
+
+import rootutils
+
+ROOT = rootutils.autosetup()
+
+from src.schema.configs import Configs, cfg
+from src.utils.logger import get_logger
+
+log = get_logger()
+
+
+def main_reindex(cfg: Configs) -> None:
+    """Rebuild the ANN indexes, e.g. to retrain IVFFlat lists on new faces."""
+    from src.db.pg_db import PgSyncDb
+
+    log.info(f"Rebuilding vector indexes")
+
+    pg = PgSyncDb(
+        host=cfg.POSTGRES_HOST,
+        port=cfg.POSTGRES_PORT,
+        user=cfg.POSTGRES_USER,
+        password=cfg.POSTGRES_PASSWORD,
+        db=cfg.POSTGRES_DB,
+        index_type=cfg.POSTGRES_INDEX_TYPE,
+        hnsw_m=cfg.POSTGRES_HNSW_M,
+        hnsw_ef_construction=cfg.POSTGRES_HNSW_EF_CONSTRUCTION,
+        ivfflat_lists=cfg.POSTGRES_IVFFLAT_LISTS,
+        quantization=cfg.POSTGRES_INDEX_QUANTIZATION,
+        index_method=cfg.POSTGRES_INDEX_METHOD,
+    )
+    pg.setup()
+    pg.create_all()
+    pg.reindex_vector_indexes()
+
+    log.info(f"Vector indexes rebuilt")
+
+
+if __name__ == "__main__":
+    """Vector index rebuild function."""
+
+    main_reindex(cfg)
@@ -8,6 +8,8 @@ from typing import Any, List, Literal, Union
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from src.schema.onnx_schema import OnnxSessionSchema
+
 
 def parse_cors(v: Any) -> Union[List[str], str]:
     """Parse CORS origins."""
@@ -37,12 +39,72 @@ class Configs(BaseSettings):
     POSTGRES_USER: str = "didi"
     POSTGRES_PASSWORD: str = "didi123"
     POSTGRES_DB: str = "vision-fr"
+    POSTGRES_POOL_SIZE: int = 10
+    POSTGRES_MAX_OVERFLOW: int = 10
+    POSTGRES_POOL_TIMEOUT: float = 10.0
+    POSTGRES_POOL_RECYCLE: int = 1800
+
+    # postgres vector index
+    POSTGRES_INDEX_TYPE: Literal["hnsw", "ivfflat", "none"] = "hnsw"
+    POSTGRES_INDEX_METHOD: Literal["cosine", "ip", "l2"] = "ip"
+    POSTGRES_HNSW_M: int = 16
+    POSTGRES_HNSW_EF_CONSTRUCTION: int = 64
+    POSTGRES_HNSW_EF_SEARCH: int = 40
+    POSTGRES_IVFFLAT_LISTS: int = 100
+    POSTGRES_IVFFLAT_PROBES: int = 1
+    POSTGRES_INDEX_QUANTIZATION: Literal["none", "halfvec", "bit"] = "none"
+    POSTGRES_RERANK_FACTOR: int = 4
 
     # fr engine
     FR_DET_ENGINE_PATH: str = "assets/yoloxs_face.onnx"
     FR_REC_ENGINE_PATH: str = "assets/w600k_mbf.onnx"
+    FR_LMK_ENGINE_PATH: str = ""
     FR_DET_MAX_END2END: int = 100
     FR_PROVIDER: Literal["cpu", "gpu"] = "cpu"
+    FR_IO_BINDING: bool = False
+    FR_REDUCED_DECODE: bool = True
+
+    # fr onnx runtime sessions, json e.g. '{"intra_op_num_threads": 4}'
+    FR_DET_SESSION: OnnxSessionSchema = OnnxSessionSchema()
+    FR_REC_SESSION: OnnxSessionSchema = OnnxSessionSchema()
+    FR_LMK_SESSION: OnnxSessionSchema = OnnxSessionSchema()
+    FR_SESSION_AUTO_TUNE: bool = True
+    FR_ENGINE_WORKERS: int = 2
+    FR_ENGINE_MAX_QUEUE: int = 64
+
+    # fr batch scheduler
+    FR_BATCH_MAX_SIZE: int = 16
+    FR_BATCH_MAX_WAIT_MS: float = 5.0
+    FR_BATCH_MAX_IMAGES: int = 64
+
+    # fr bulk enrollment
+    FR_ENROLL_BATCH_SIZE: int = 32
+    FR_ENROLL_WORKERS: int = 2
+    FR_ENROLL_COMMIT_SIZE: int = 5000
+
+    # fr stream tracker
+    FR_TRACKER_MATCH_IOU: float = 0.3
+    FR_TRACKER_REEMBED_IOU: float = 0.6
+    FR_TRACKER_MAX_AGE: float = 2.0
+    FR_TRACKER_MAX_MISSES: int = 5
+
+    # fr engine result cache
+    FR_CACHE_ENABLED: bool = False
+    FR_CACHE_MAX_SIZE: int = 1024
+    FR_CACHE_TTL: float = 300.0
+    FR_CACHE_SHARED_PATH: str = ""
+
+    # fr in-memory gallery
+    FR_GALLERY_ENABLED: bool = False
+    FR_GALLERY_SYNC_INTERVAL: float = 300.0
+    FR_GALLERY_REFRESH_INTERVAL: float = 1.0
+    FR_GALLERY_SHARED_DIR: str = ""
+    FR_GALLERY_FLUSH_INTERVAL: float = 5.0
+    FR_GALLERY_QUANTIZATION: Literal["none", "halfvec", "bit"] = "none"
+    FR_GALLERY_RERANK_FACTOR: int = 4
+
+    # fr identity search, second stage on all samples of the nearest identities
+    FR_SEARCH_SAMPLES: bool = False
 
 
 cfg = Configs()
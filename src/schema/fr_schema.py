@@ -9,7 +9,7 @@ from typing import Any, List, Optional
 
 from pgvector.sqlalchemy import Vector
 from pydantic import BaseModel, Field
-from sqlalchemy import Column
+from sqlalchemy import Column, ForeignKey, Index, Integer
 from sqlmodel import Field as SqlField
 from sqlmodel import SQLModel
 
@@ -23,22 +23,111 @@ class FrResultSchema(YoloResultSchema):
 
 
 class FacesFrSqlSchema(SQLModel, table=True):
-    """Faces face recognition schema."""
+    """
+    Faces (identities) face recognition schema. The embedding is the
+    normalized centroid of the identity samples (`face_embeddings`).
+    """
 
     __tablename__ = "faces"
+    __table_args__ = (
+        # name prefix search (LIKE 'abc%')
+        Index(
+            "faces_name_pattern_idx",
+            "name",
+            postgresql_ops={"name": "text_pattern_ops"},
+        ),
+    )
 
     id: Optional[int] = SqlField(default=None, primary_key=True)
-    name: str = SqlField(..., max_length=100)
+    name: str = SqlField(..., max_length=100, unique=True)
     embedding: Any = SqlField([], sa_column=Column(Vector(512)))
     created_at: datetime = SqlField(...)
     updated_at: datetime = SqlField(...)
 
 
+class FaceEmbeddingsFrSqlSchema(SQLModel, table=True):
+    """Face embeddings (samples of an identity) face recognition schema."""
+
+    __tablename__ = "face_embeddings"
+
+    id: Optional[int] = SqlField(default=None, primary_key=True)
+    face_id: int = SqlField(
+        ...,
+        sa_column=Column(
+            Integer,
+            ForeignKey("faces.id", ondelete="CASCADE"),
+            nullable=False,
+            index=True,
+        ),
+    )
+    # read by face id only, no ANN index
+    embedding: Any = SqlField(
+        [], sa_column=Column(Vector(512), info={"vector_index": False})
+    )
+    created_at: datetime = SqlField(...)
+
+
+class MatchFacesFrSchema(BaseModel):
+    """Match (nearest neighbour) faces face recognition schema."""
+
+    id: int = Field(..., example=1)
+    name: str = Field(..., example="John Doe")
+    distance: float = Field(..., example=0.25)
+
+
 class ReadFacesFrSchema(BaseModel):
     """Read faces face recognition schema."""
 
     id: Optional[int] = Field(None, example=1)
     name: str = Field(None, example="John Doe")
     box: Optional[List[int]] = Field(None, example=[0, 0, 100, 100])
+    distance: Optional[float] = Field(None, example=0.25)
+    matches: Optional[List[MatchFacesFrSchema]] = Field(None)
     created_at: Optional[datetime] = Field(None)
     updated_at: Optional[datetime] = Field(None)
+
+
+class PageFacesFrSchema(BaseModel):
+    """Page (keyset) of faces face recognition schema."""
+
+    faces: List[ReadFacesFrSchema] = Field([])
+    next_cursor: Optional[int] = Field(None, example=100)
+
+
+class RecognizeBatchFrSchema(BaseModel):
+    """Recognize batch (per image) face recognition schema."""
+
+    filename: Optional[str] = Field(None, example="frame_0001.jpg")
+    faces: List[ReadFacesFrSchema] = Field([])
+
+
+class StreamFaceFrSchema(ReadFacesFrSchema):
+    """Stream (tracked) face recognition schema."""
+
+    track_id: Optional[int] = Field(None, example=7)
+
+
+class StreamFrSchema(BaseModel):
+    """Stream (per processed frame) face recognition schema."""
+
+    frame: int = Field(..., example=42)
+    dropped: int = Field(0, example=3)
+    embedded: int = Field(0, example=1)
+    faces: List[StreamFaceFrSchema] = Field([])
+    error: Optional[str] = Field(None, example="busy")
+
+
+class EnrollRejectFrSchema(BaseModel):
+    """Enroll (rejected image) face recognition schema."""
+
+    filename: str = Field(..., example="john_doe.jpg")
+    name: str = Field(..., example="john_doe")
+    reason: str = Field(..., example="no face")
+
+
+class EnrollFrSchema(BaseModel):
+    """Enroll (bulk) face recognition schema."""
+
+    enrolled: int = Field(0, example=1000)
+    skipped: int = Field(0, example=0)
+    rejected: List[EnrollRejectFrSchema] = Field([])
@@ -4,7 +4,7 @@ import rootutils
 
 ROOT = rootutils.autosetup()
 
-from typing import List
+from typing import List, Literal, Optional
 
 import numpy as np
 from pydantic import BaseModel, Field, model_validator
@@ -27,3 +27,24 @@ class OnnxMetadataSchema(BaseModel):
             self.output_shape = [-1]
 
         return self
+
+
+class OnnxSessionSchema(BaseModel):
+    """ONNX runtime session options schema."""
+
+    intra_op_num_threads: int = Field(0, example=4, description="0: auto")
+    inter_op_num_threads: int = Field(0, example=1, description="0: auto")
+    graph_optimization_level: Literal["disable", "basic", "extended", "all"] = Field(
+        "all", example="all"
+    )
+    execution_mode: Literal["sequential", "parallel"] = Field(
+        "sequential", example="sequential"
+    )
+    enable_mem_pattern: bool = Field(True, example=True)
+    enable_cpu_mem_arena: bool = Field(True, example=True)
+    allow_spinning: Optional[bool] = Field(
+        None, example=False, description="None: auto"
+    )
+    optimized_model_filepath: Optional[str] = Field(
+        None, example="tmp/yoloxs_face.opt.onnx"
+    )
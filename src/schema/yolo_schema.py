@@ -7,19 +7,44 @@ ROOT = rootutils.autosetup()
 from typing import List
 
 import numpy as np
-from pydantic import BaseModel, Field, model_validator
-
-
-class YoloE2EResultSchema(BaseModel):
-    """Yolo end2end result schema."""
-
-    num_dets: int = Field(..., example=20)
-    boxes: np.ndarray = Field(..., example=[0, 0, 100, 100, 50, 50, 150, 150])
-    scores: np.ndarray = Field(..., example=[0.9, 0.8])
-    classes: np.ndarray = Field(..., example=[0, 1])
-
-    class Config:
-        arbitrary_types_allowed = True
+from pydantic import BaseModel, Field
+
+
+class YoloResult:
+    """
+    YOLO engine detection result, array-backed. Boxes are already clipped to
+    the image and scores rounded, validation is left to the response schema.
+    """
+
+    def __init__(
+        self,
+        boxes: np.ndarray,
+        scores: np.ndarray,
+        classes: np.ndarray,
+        names: List[str],
+    ) -> None:
+        """Initialize YOLO detection result."""
+        self.boxes = boxes
+        self.scores = scores
+        self.classes = classes
+        self.names = names
+
+    def __len__(self) -> int:
+        """Number of detections."""
+        return len(self.boxes)
+
+    @property
+    def categories(self) -> List[str]:
+        """Category name of every detection."""
+        return [self.names[c] for c in self.classes.tolist()]
+
+    def to_dict(self) -> dict:
+        """Detections as plain python lists."""
+        return {
+            "boxes": self.boxes.tolist(),
+            "scores": self.scores.tolist(),
+            "categories": self.categories,
+        }
 
 
 class YoloResultSchema(BaseModel):
@@ -28,11 +53,3 @@ class YoloResultSchema(BaseModel):
     boxes: List[List[int]] = Field([], example=[[0, 0, 100, 100], [50, 50, 150, 150]])
     scores: List[float] = Field([], example=[0.9, 0.8])
     categories: List[str] = Field([], example=["person", "car"])
-
-    @model_validator(mode="after")
-    def validator(self) -> "YoloResultSchema":
-        """Model validator."""
-        self.scores = [round(x, 2) for x in self.scores]
-        self.boxes = [[max(x, 1) for x in box] for box in self.boxes]
-
-        return self
\ No newline at end of file
@@ -0,0 +1,73 @@
+"""Bounded executor utils."""
+
+import rootutils
+
+ROOT = rootutils.autosetup()
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+from src.utils.logger import get_logger
+
+log = get_logger()
+
+
+class ExecutorBusyError(Exception):
+    """Raised when an executor queue is full."""
+
+
+class BoundedExecutor:
+    """
+    Thread pool executor with a bounded queue.
+
+    Blocking work (ONNX runtime, DB drivers) is run off the event loop. When
+    more than `max_workers + max_queue` jobs are pending, new jobs are
+    rejected with `ExecutorBusyError` instead of queueing without bound.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int) -> None:
+        """Initialize bounded executor."""
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.pending = 0
+
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+    @property
+    def is_full(self) -> bool:
+        """Whether the executor is rejecting new jobs."""
+        return self.pending >= self.max_workers + self.max_queue
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a blocking function in the pool and await its result."""
+        if self.is_full:
+            log.warning(f"Executor {self.name} is full ({self.pending} pending)")
+            raise ExecutorBusyError(f"Executor {self.name} is busy")
+
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.pool, partial(fn, *args, **kwargs)
+            )
+        finally:
+            self.pending -= 1
+
+    async def run_unbounded(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run a blocking function in the pool even when it is full, for work that
+        must not be rejected (e.g. applying a change already committed).
+        """
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.pool, partial(fn, *args, **kwargs)
+            )
+        finally:
+            self.pending -= 1
+
+    def shutdown(self) -> None:
+        """Shutdown the thread pool."""
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,106 @@
+"""Image decoding utils."""
+
+import rootutils
+
+ROOT = rootutils.autosetup()
+
+import math
+from io import BytesIO
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from src.utils.logger import get_logger
+
+log = get_logger()
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff"}
+
+
+def decode_image(img_bytes: bytes, min_side: Optional[int] = None) -> np.ndarray:
+    """
+    Decode encoded image bytes to a RGB uint8 array (H, W, 3).
+
+    The EXIF orientation is applied and every colour mode (grayscale, palette,
+    alpha, CMYK, 16-bit) is converted to RGB. With `min_side`, JPEGs are
+    decoded at the smallest DCT scale (1/2, 1/4, 1/8) keeping both sides at
+    least `min_side` pixels, which skips most of the decoding work.
+    """
+    img = Image.open(BytesIO(img_bytes))
+    if min_side is not None:
+        img.draft("RGB", (min_side, min_side))
+    img = ImageOps.exif_transpose(img)
+    if img.mode.startswith("I"):
+        # 16/32-bit grayscale, scaled to 8 bits (convert would clip at 255)
+        img = Image.fromarray(np.clip(np.asarray(img) >> 8, 0, 255).astype(np.uint8))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+
+    # single copy out of PIL, read-only
+    return np.asarray(img)
+
+
+class EncodedImage:
+    """
+    Encoded image with a two-resolution decode.
+
+    The image is decoded once at reduced resolution (enough for the detector
+    input, `det_side`), while face crops are re-decoded lazily at the smallest
+    scale that still keeps every face at least `min_face` pixels. Boxes are
+    exchanged in full resolution coordinates.
+    """
+
+    def __init__(self, img_bytes: bytes, det_side: Optional[int] = None) -> None:
+        """Initialize encoded image, decoding the detection image."""
+        self.img_bytes = img_bytes
+        self.det_side = det_side
+
+        # full resolution (oriented) size, from the header only
+        with Image.open(BytesIO(img_bytes)) as img:
+            self.width, self.height = img.size
+            if img.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                self.width, self.height = self.height, self.width
+
+        self.img = decode_image(img_bytes, min_side=det_side)
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        """Full resolution shape (H, W, 3)."""
+        return self.height, self.width, 3
+
+    def scale_boxes(self, boxes: np.ndarray) -> np.ndarray:
+        """Scale boxes (N, 4) of the detection image to full resolution."""
+        sx = self.width / self.img.shape[1]
+        sy = self.height / self.img.shape[0]
+        if sx == 1 and sy == 1:
+            return boxes
+
+        return np.rint(boxes * np.array([sx, sy, sx, sy])).astype(np.int32)
+
+    def crop_faces(
+        self, boxes: List[List[int]], min_face: int = 112
+    ) -> List[np.ndarray]:
+        """Crop faces (full resolution boxes), decoding only as much as needed."""
+        if len(boxes) == 0:
+            return []
+
+        # smallest scale keeping the smallest face side >= min_face
+        smallest = min(min(x2 - x1, y2 - y1) for x1, y1, x2, y2 in boxes)
+        min_side = math.ceil(min(self.width, self.height) * min_face / max(smallest, 1))
+        img = self.img
+        if min_side > min(img.shape[:2]) and img.shape[:2] != self.shape[:2]:
+            img = decode_image(self.img_bytes, min_side=min_side)
+
+        sx = img.shape[1] / self.width
+        sy = img.shape[0] / self.height
+        faces: List[np.ndarray] = []
+        for x1, y1, x2, y2 in boxes:
+            face = img[
+                math.floor(y1 * sy) : math.ceil(y2 * sy),
+                math.floor(x1 * sx) : math.ceil(x2 * sx),
+            ]
+            # copy, so the re-decoded image is released
+            faces.append(face.copy() if img is not self.img else face)
+
+        return faces
@@ -0,0 +1,62 @@
+"""Face recognition micro-batching scheduler tests."""
+
+import rootutils
+
+ROOT = rootutils.autosetup()
+
+import asyncio
+from typing import List
+
+from src.engine.batch_scheduler import FrBatchScheduler
+from src.utils.executor import BoundedExecutor
+
+
+class FakeEngine:
+    """Engine returning its inputs, failing on any "bad" image."""
+
+    def __init__(self) -> None:
+        self.calls: List[int] = []
+
+    def predict(self, imgs: list, det_conf: float, det_nms: float) -> list:
+        self.calls.append(len(imgs))
+        if "bad" in imgs:
+            raise ValueError("bad image")
+
+        return [f"result {img}" for img in imgs]
+
+
+def test_batch_coalesced():
+    """Concurrent requests run in one engine call."""
+    engine = FakeEngine()
+    executor = BoundedExecutor("test", max_workers=1, max_queue=8)
+    scheduler = FrBatchScheduler(engine, executor, max_wait_ms=50.0)
+
+    async def run():
+        results = await asyncio.gather(*(scheduler.predict(i) for i in range(4)))
+        await scheduler.stop()
+        return results
+
+    assert asyncio.run(run()) == [f"result {i}" for i in range(4)]
+    assert engine.calls == [4]
+    assert scheduler.worker is None
+
+
+def test_batch_bad_image():
+    """A bad image fails its own request only."""
+    engine = FakeEngine()
+    executor = BoundedExecutor("test", max_workers=1, max_queue=8)
+    scheduler = FrBatchScheduler(engine, executor, max_wait_ms=50.0)
+
+    async def run():
+        imgs = ["a", "bad", "b"]
+        results = await asyncio.gather(
+            *(scheduler.predict(img) for img in imgs), return_exceptions=True
+        )
+        await scheduler.stop()
+        return results
+
+    ok_a, bad, ok_b = asyncio.run(run())
+
+    assert (ok_a, ok_b) == ("result a", "result b")
+    assert isinstance(bad, ValueError)
+    assert engine.calls == [3, 1, 1, 1]
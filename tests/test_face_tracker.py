@@ -0,0 +1,64 @@
+"""Face tracker tests."""
+
+import rootutils
+
+ROOT = rootutils.autosetup()
+
+import numpy as np
+
+from src.engine.face_tracker import FaceTracker, iou_matrix
+
+
+def test_iou_matrix():
+    """Pairwise IoU of xyxy boxes."""
+    ious = iou_matrix(
+        [[0, 0, 10, 10]], [[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30]]
+    )
+
+    np.testing.assert_allclose(ious, [[1.0, 1 / 3, 0.0]], rtol=1e-6)
+
+
+def test_update_ndarray_boxes():
+    """Detections as arrays (detector output) are tracked across frames."""
+    tracker = FaceTracker()
+    boxes = np.array([[10, 10, 50, 50], [100, 100, 150, 150]], dtype=np.int32)
+
+    first = tracker.update(boxes)
+    second = tracker.update(boxes + 2)
+
+    assert [t.track_id for t in first] == [1, 2]
+    assert [t.track_id for t in second] == [1, 2]
+
+
+def test_update_no_detections():
+    """Empty frames age tracks out after `max_misses`."""
+    tracker = FaceTracker(max_misses=1)
+    tracker.update(np.array([[10, 10, 50, 50]], dtype=np.int32))
+
+    assert tracker.update(np.zeros((0, 4), dtype=np.int32)) == []
+    assert len(tracker.tracks) == 1
+    assert tracker.update([]) == []
+    assert tracker.tracks == []
+
+
+def test_update_new_track():
+    """A detection without overlap starts a new track."""
+    tracker = FaceTracker()
+    tracker.update([[10, 10, 50, 50]])
+    tracks = tracker.update([[10, 10, 50, 50], [200, 200, 240, 240]])
+
+    assert [t.track_id for t in tracks] == [1, 2]
+
+
+def test_needs_embedding():
+    """Tracks are re-embedded when new or moved, not when still."""
+    tracker = FaceTracker(reembed_iou=0.6, max_age=60.0)
+    (track,) = tracker.update([[10, 10, 50, 50]])
+    assert tracker.needs_embedding(track)
+
+    track.set_match([])
+    (track,) = tracker.update([[11, 11, 51, 51]])
+    assert not tracker.needs_embedding(track)
+
+    (track,) = tracker.update([[40, 40, 80, 80]])
+    assert tracker.needs_embedding(track)
@@ -0,0 +1,77 @@
+"""Face recognition result cache tests."""
+
+import rootutils
+
+ROOT = rootutils.autosetup()
+
+import asyncio
+import os
+
+from src.engine.fr_cache import FrResultCache, SharedFrResultCache
+from src.schema.fr_schema import FrResultSchema
+
+
+def result(i: int) -> FrResultSchema:
+    """Engine result of a single face."""
+    return FrResultSchema(
+        boxes=[[i, i, i + 10, i + 10]],
+        scores=[0.9],
+        categories=["face"],
+        embeddings=[[float(i), 1.0]],
+    )
+
+
+def test_lru_eviction():
+    """The least recently used entries are evicted."""
+    cache = FrResultCache(max_size=2)
+    cache.put("a", result(0))
+    cache.put("b", result(1))
+    cache.get("a")
+    cache.put("c", result(2))
+
+    assert cache.get("b") is None
+    assert cache.get("a") == result(0)
+    assert cache.stats()["hits"] == 2
+
+
+def test_shared_async(tmp_path):
+    """Shared entries are read and written off the event loop, across instances."""
+    cache = SharedFrResultCache(str(tmp_path / "cache.sqlite"))
+    other = SharedFrResultCache(str(tmp_path / "cache.sqlite"))
+
+    async def run():
+        await cache.aput("a", result(0))
+        return await other.aget("a"), await other.aget("b"), await cache.astats()
+
+    hit, miss, stats = asyncio.run(run())
+
+    assert hit == result(0)
+    assert miss is None
+    assert stats["size"] == 1
+
+
+def test_shared_eviction(tmp_path):
+    """Shared entries over `max_size` are evicted every `evict_interval` writes."""
+    cache = SharedFrResultCache(
+        str(tmp_path / "cache.sqlite"), max_size=4, evict_interval=8
+    )
+    for i in range(7):
+        cache.put(str(i), result(i))
+    assert cache.size() == 7
+
+    cache.put("7", result(7))
+    assert cache.size() == 4
+    assert cache.get("7") == result(7)
+
+
+def test_shared_fork(tmp_path, monkeypatch):
+    """No connection is opened before use, nor reused by a forked worker."""
+    cache = SharedFrResultCache(str(tmp_path / "cache.sqlite"))
+    assert not (tmp_path / "cache.sqlite").exists()
+
+    cache.put("a", result(0))
+    conn = cache.connect()
+    monkeypatch.setattr(os, "getpid", lambda: -1)
+
+    assert cache.connect() is not conn
+    assert cache.get("a") == result(0)
@@ -0,0 +1,246 @@
+"""Face recognition gallery tests."""
+
+import rootutils
+
+ROOT = rootutils.autosetup()
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from src.engine.fr_gallery import (
+    FrGallery,
+    SharedFrGallery,
+    hamming_distances,
+    l2_normalize,
+    pack_bits,
+)
+
+DIM = 64
+
+
+def make_faces(n: int = 200, seed: int = 0):
+    """Ids, metas and embeddings of `n` random faces."""
+    rng = np.random.default_rng(seed)
+    embds = rng.standard_normal((n, DIM), dtype=np.float32)
+    now = datetime(2024, 1, 1)
+    metas = [(f"face{i}", now, now) for i in range(n)]
+
+    return list(range(1, n + 1)), metas, embds
+
+
+def exact_search(embds: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Indexes (q, k) of the nearest embeddings by cosine distance."""
+    dists = 1.0 - l2_normalize(queries) @ l2_normalize(embds).T
+
+    return np.argsort(dists, axis=1, kind="stable")[:, :k]
+
+
+def test_hamming_distances():
+    """Hamming distances of packed codes match a bitwise count."""
+    rng = np.random.default_rng(0)
+    a = pack_bits(rng.standard_normal((3, DIM)))
+    b = pack_bits(rng.standard_normal((50, DIM)))
+    expected = np.unpackbits(a[:, None] ^ b[None], axis=-1).sum(-1)
+
+    np.testing.assert_array_equal(hamming_distances(a, b), expected)
+
+
+@pytest.mark.parametrize("quantization", ["none", "halfvec"])
+def test_search_exact(quantization):
+    """Float and halfvec galleries return the exact nearest faces."""
+    ids, metas, embds = make_faces()
+    gallery = FrGallery(DIM, quantization=quantization)
+    gallery.load(ids, metas, embds)
+    queries = embds[:10] + 0.1
+
+    results = gallery.search(queries.tolist(), distance=2.0, k=5)
+
+    expected = exact_search(embds, queries, 5) + 1
+    assert [[m["id"] for m in matches] for matches in results] == expected.tolist()
+    assert results[0][0]["name"] == "face0"
+    assert results[0][0]["distance"] < results[0][1]["distance"]
+
+
+def test_search_bit_rerank():
+    """Binary quantized candidates re-ranked by cosine find the nearest face."""
+    ids, metas, embds = make_faces(1000)
+    gallery = FrGallery(DIM, quantization="bit", rerank_factor=10)
+    gallery.load(ids, metas, embds)
+    noise = np.random.default_rng(1).standard_normal((20, DIM), dtype=np.float32)
+
+    results = gallery.search((embds[:20] + 0.2 * noise).tolist(), 2.0, k=1)
+
+    assert [matches[0]["id"] for matches in results] == ids[:20]
+
+
+def test_search_distance_methods():
+    """Matches are cut at `distance`, l2 is derived from the cosine distance."""
+    ids, metas, embds = make_faces()
+    gallery = FrGallery(DIM)
+    gallery.load(ids, metas, embds)
+
+    (ip,) = gallery.search(embds[:1].tolist(), distance=0.5, k=5)
+    (l2,) = gallery.search(embds[:1].tolist(), distance=2.0, k=5, method="l2")
+
+    assert all(m["distance"] < 0.5 for m in ip)
+    assert ip[0]["distance"] == pytest.approx(0.0, abs=1e-5)
+    assert l2[1]["distance"] == pytest.approx(
+        np.sqrt(2 * gallery.search(embds[:1].tolist(), 2.0, 5)[0][1]["distance"]),
+        rel=1e-5,
+    )
+
+
+def test_add_remove():
+    """Faces are added (growing the gallery), replaced and removed."""
+    ids, metas, embds = make_faces(10)
+    gallery = FrGallery(DIM, capacity=2)
+    for face_id, (name, created_at, updated_at), embd in zip(ids, metas, embds):
+        gallery.add(face_id, name, embd, created_at, updated_at)
+    assert len(gallery) == 10
+
+    gallery.add(3, "renamed", embds[0])
+    assert gallery.search(embds[:1].tolist(), 1e-3, k=2)[0][1]["name"] == "renamed"
+
+    assert gallery.remove(1)
+    assert not gallery.remove(1)
+    assert len(gallery) == 9
+    assert gallery.search(embds[:1].tolist(), 1e-3, k=1)[0][0]["id"] == 3
+
+
+def test_load_headroom():
+    """A loaded gallery has room for adds without copying it."""
+    ids, metas, embds = make_faces(8)
+    gallery = FrGallery(DIM)
+    gallery.load(ids[:-1], metas[:-1], embds[:-1])
+    matrix = gallery.embds
+
+    gallery.add(ids[-1], "new", embds[-1])
+
+    assert gallery.embds is matrix
+    assert gallery.search(embds[[-1]].tolist(), 1e-3)[0][0]["id"] == ids[-1]
+
+
+def test_load_replays_changes():
+    """Changes made while a snapshot is read are replayed over it."""
+    ids, metas, embds = make_faces(10)
+    gallery = FrGallery(DIM)
+    gallery.load(ids[:-1], metas[:-1], embds[:-1])
+
+    # snapshot read before the changes
+    gallery.begin_sync()
+    gallery.add(ids[-1], "new", embds[-1])
+    gallery.remove(1)
+    gallery.load(ids[:-1], metas[:-1], embds[:-1])
+
+    assert len(gallery) == len(ids) - 1
+    assert gallery.search(embds[[-1]].tolist(), 1e-3)[0][0]["name"] == "new"
+    assert gallery.search(embds[:1].tolist(), 1e-3) == [[]]
+
+
+def test_search_samples():
+    """With samples, identities are re-ranked by their closest sample."""
+    ids, metas, embds = make_faces(3)
+    gallery = FrGallery(DIM, search_samples=True)
+    # face 2 centroid is far from the query, but one of its samples is it
+    samples = [embds[:1], np.stack([embds[2], embds[0]]), embds[2:3]]
+    gallery.load(ids, metas, np.stack([embds[0] + 1.0, embds[1], embds[2]]), samples)
+
+    (matches,) = gallery.search(embds[:1].tolist(), 2.0, k=2)
+
+    assert [m["id"] for m in matches] == [1, 2]
+    assert matches[0]["distance"] == pytest.approx(0.0, abs=1e-5)
+
+
+def test_shared_gallery(tmp_path):
+    """Published generations and flushed overlays are seen by other workers."""
+    ids, metas, embds = make_faces()
+    gallery = SharedFrGallery(str(tmp_path), DIM, flush_interval=0.0)
+    other = SharedFrGallery(str(tmp_path), DIM, flush_interval=0.0)
+    gallery.load(ids[:-1], metas[:-1], embds[:-1])
+    other.refresh()
+    assert len(other) == len(ids) - 1
+
+    # local changes are searched before they are flushed
+    gallery.add(ids[-1], "new", embds[-1], *metas[-1][1:])
+    gallery.remove(1)
+    (matches,) = gallery.search(embds[[-1]].tolist(), 1e-3, k=1)
+    assert matches[0]["name"] == "new"
+    assert gallery.search(embds[:1].tolist(), 1e-3, k=1) == [[]]
+
+    gallery.refresh()
+    other.refresh()
+    (matches,) = other.search(embds[[-1]].tolist(), 1e-3, k=1)
+    assert matches[0] == {
+        "id": ids[-1],
+        "name": "new",
+        "distance": pytest.approx(0.0, abs=1e-5),
+        "created_at": metas[-1][1],
+        "updated_at": metas[-1][2],
+    }
+    assert other.search(embds[:1].tolist(), 1e-3, k=1) == [[]]
+    assert len(other) == len(ids) - 1
+
+
+def test_shared_gallery_sync(tmp_path):
+    """Flushes wait for a sync, and are not overwritten by its snapshot."""
+    ids, metas, embds = make_faces(10)
+    gallery = SharedFrGallery(str(tmp_path), DIM, flush_interval=0.0)
+    other = SharedFrGallery(str(tmp_path), DIM, flush_interval=0.0)
+    gallery.load(ids[:-1], metas[:-1], embds[:-1])
+
+    # snapshot read before the changes of the other worker
+    gallery.begin_sync()
+    other.refresh()
+    other.add(ids[-1], "new", embds[-1])
+    other.remove(1)
+    other.refresh()
+    assert len(other.overlay) == 1
+    gallery.load(ids[:-1], metas[:-1], embds[:-1])
+
+    other.refresh()
+    gallery.refresh()
+    assert len(other.overlay) == 0
+    assert gallery.search(embds[[-1]].tolist(), 1e-3)[0][0]["name"] == "new"
+    assert gallery.search(embds[:1].tolist(), 1e-3) == [[]]
+
+
+def test_shared_gallery_samples(tmp_path):
+    """Samples are published with the shared gallery."""
+    ids, metas, embds = make_faces(3)
+    gallery = SharedFrGallery(str(tmp_path), DIM, search_samples=True)
+    samples = [embds[:1], np.stack([embds[2], embds[0]]), embds[2:3]]
+    gallery.load(ids, metas, np.stack([embds[0] + 1.0, embds[1], embds[2]]), samples)
+
+    (matches,) = gallery.search(embds[:1].tolist(), 2.0, k=2)
+
+    assert [m["id"] for m in matches] == [1, 2]
+    assert gallery.get_samples(1).shape == (2, DIM)
+
+
+def test_shared_gallery_single_reload(tmp_path):
+    """Of workers syncing a stale gallery at once, a single one reloads it."""
+    ids, metas, embds = make_faces(10)
+    gallery = SharedFrGallery(str(tmp_path), DIM)
+    other = SharedFrGallery(str(tmp_path), DIM)
+    gallery.load(ids[:-1], metas[:-1], embds[:-1])
+    other.refresh()
+    time.sleep(0.01)
+    assert gallery.is_stale(0.01) and other.is_stale(0.01)
+
+    # the other worker waits for the sync lock, then maps the new generation
+    assert gallery.begin_sync(0.01)
+    with ThreadPoolExecutor(1) as pool:
+        waiting = pool.submit(other.begin_sync, 0.01)
+        time.sleep(0.05)
+        assert not waiting.done()
+        gallery.load(ids, metas, embds)
+        assert not waiting.result()
+
+    # a single generation was published over the first one
+    assert other.sync_lock is None
+    assert other.generation == gallery.generation == 1
+    assert len(other) == len(ids)
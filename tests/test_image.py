@@ -0,0 +1,78 @@
+"""Image decoding tests."""
+
+import rootutils
+
+ROOT = rootutils.autosetup()
+
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.utils.image import EncodedImage, decode_image
+
+
+def encode(img: Image.Image, fmt: str = "PNG", **kwargs) -> bytes:
+    """Encode a PIL image."""
+    buffer = BytesIO()
+    img.save(buffer, fmt, **kwargs)
+
+    return buffer.getvalue()
+
+
+def gradient(h: int = 64, w: int = 96) -> np.ndarray:
+    """RGB uint8 gradient image."""
+    x = np.linspace(0, 255, w, dtype=np.float32)[None, :, None]
+    y = np.linspace(0, 255, h, dtype=np.float32)[:, None, None]
+
+    return np.broadcast_to((x + y) / 2, (h, w, 3)).astype(np.uint8)
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L", "P", "CMYK"])
+def test_decode_modes(mode):
+    """Every colour mode decodes to RGB uint8."""
+    img = Image.fromarray(gradient()).convert(mode)
+    fmt = "JPEG" if mode == "CMYK" else "PNG"
+    decoded = decode_image(encode(img, fmt))
+
+    assert decoded.shape == (64, 96, 3)
+    assert decoded.dtype == np.uint8
+
+
+@pytest.mark.parametrize("dtype", [np.uint16, np.int32])
+def test_decode_16bit(dtype):
+    """16-bit grayscale is scaled to 8 bits, not clipped."""
+    values = np.linspace(0, 65535, 256).astype(dtype)
+    decoded = decode_image(encode(Image.fromarray(np.tile(values, (8, 1)))))
+
+    assert decoded.shape == (8, 256, 3)
+    np.testing.assert_array_equal(decoded[0, :, 0], values.astype(np.int64) >> 8)
+
+
+def test_decode_exif_orientation():
+    """The EXIF orientation is applied."""
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotated 90 degrees
+    img_bytes = encode(Image.fromarray(gradient()), "JPEG", exif=exif)
+
+    assert decode_image(img_bytes).shape == (96, 64, 3)
+    assert EncodedImage(img_bytes).width == 64
+
+
+def test_decode_min_side():
+    """JPEGs are decoded at a reduced scale keeping `min_side`."""
+    img_bytes = encode(Image.fromarray(gradient(800, 1200)), "JPEG")
+
+    assert decode_image(img_bytes).shape == (800, 1200, 3)
+    assert decode_image(img_bytes, min_side=200).shape == (200, 300, 3)
+
+
+def test_encoded_image_boxes():
+    """Boxes of the reduced detection image are scaled to full resolution."""
+    img = EncodedImage(encode(Image.fromarray(gradient(800, 1200)), "JPEG"), 200)
+    boxes = img.scale_boxes(np.array([[10, 20, 30, 40]], dtype=np.int32))
+
+    np.testing.assert_array_equal(boxes, [[40, 80, 120, 160]])
+    (face,) = img.crop_faces(boxes, min_face=112)
+    assert face.shape == (80, 80, 3)
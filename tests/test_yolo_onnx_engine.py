@@ -0,0 +1,130 @@
+"""YOLOX ONNX engine pre/postprocessing tests."""
+
+import rootutils
+
+ROOT = rootutils.autosetup()
+
+from typing import List
+
+import cv2
+import numpy as np
+import pytest
+
+from src.engine.yolo_onnx_engine import YoloxOnnxEngine
+
+
+@pytest.fixture
+def engine() -> YoloxOnnxEngine:
+    """Engine without a session, pre/postprocessing only."""
+    engine = YoloxOnnxEngine("yolox.onnx", categories=["face"])
+    engine.img_shape = [640, 640]
+
+    return engine
+
+
+def letterbox(imgs: List[np.ndarray], dst_shape: List[int]) -> np.ndarray:
+    """Reference letterbox (resize and pad with 114) to NCHW float32."""
+    dst_h, dst_w = dst_shape
+    outputs = []
+    for img in imgs:
+        src_h, src_w = img.shape[:2]
+        ratio = min(dst_w / src_w, dst_h / src_h)
+        resized_w, resized_h = int(src_w * ratio), int(src_h * ratio)
+        dw, dh = (dst_w - resized_w) / 2, (dst_h - resized_h) / 2
+        img = cv2.resize(img, (resized_w, resized_h))
+        top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+        left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+        img = cv2.copyMakeBorder(
+            img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114)
+        )
+        outputs.append(img.transpose((2, 0, 1)).astype(np.float32))
+
+    return np.stack(outputs)
+
+
+def postprocess(outputs, ratios, pads, sizes, conf, categories):
+    """Reference per image postprocess of end2end outputs."""
+    results = []
+    for i in range(len(outputs[0])):
+        num_dets = int(outputs[0][i][0])
+        boxes = outputs[1][i][:num_dets].copy()
+        scores = outputs[2][i][:num_dets]
+        classes = outputs[3][i][:num_dets]
+        boxes[:, 0::2] -= pads[i][0]
+        boxes[:, 1::2] -= pads[i][1]
+        boxes /= ratios[i]
+        boxes = np.clip(boxes, 0, np.tile(sizes[i], 2))
+        mask = (scores > conf) & (classes < len(categories))
+        results.append(
+            (
+                boxes[mask].astype(np.int32).tolist(),
+                [round(x, 2) for x in scores[mask].tolist()],
+                [categories[int(c)] for c in classes[mask]],
+            )
+        )
+
+    return results
+
+
+@pytest.mark.parametrize(
+    "shapes", [[(480, 640), (1080, 1920), (641, 333)], [(640, 640)], [(100, 50)]]
+)
+def test_preprocess(engine, shapes):
+    """Letterboxed batch matches the reference, with its ratios and pads."""
+    rng = np.random.default_rng(0)
+    imgs = [rng.integers(0, 255, (h, w, 3), dtype=np.uint8) for h, w in shapes]
+    inputs, ratios, pads = engine.preprocess_imgs(imgs)
+
+    np.testing.assert_array_equal(inputs, letterbox(imgs, engine.img_shape))
+    for (h, w), ratio, (dw, dh) in zip(shapes, ratios, pads):
+        expected = min(640 / w, 640 / h)
+        assert ratio == pytest.approx(expected)
+        assert dw == pytest.approx((640 - int(w * expected)) / 2)
+        assert dh == pytest.approx((640 - int(h * expected)) / 2)
+
+
+def test_postprocess(engine):
+    """Batched postprocess matches the per image reference."""
+    rng = np.random.default_rng(0)
+    batch, max_det = 8, 100
+    num_dets = rng.integers(0, max_det, (batch, 1)).astype(np.int32)
+    xy = rng.uniform(-20, 600, (batch, max_det, 2))
+    wh = rng.uniform(5, 100, (batch, max_det, 2))
+    boxes = np.concatenate([xy, xy + wh], -1).astype(np.float32)
+    scores = rng.uniform(0, 1, (batch, max_det)).astype(np.float32)
+    classes = rng.integers(0, 2, (batch, max_det)).astype(np.int32)
+    outputs = [num_dets, boxes, scores, classes]
+    ratios = rng.uniform(0.3, 2.0, batch).astype(np.float32)
+    pads = rng.uniform(0, 100, (batch, 2)).astype(np.float32)
+    sizes = rng.integers(200, 800, (batch, 2)).astype(np.float32)
+
+    results = engine.postprocess_end2end(outputs, ratios, pads, sizes, 0.25)
+    expected = postprocess(outputs, ratios, pads, sizes, 0.25, engine.categories)
+
+    assert len(results) == batch
+    for result, (exp_boxes, exp_scores, exp_categories) in zip(results, expected):
+        assert result.to_dict() == {
+            "boxes": exp_boxes,
+            "scores": exp_scores,
+            "categories": exp_categories,
+        }
+        assert len(result) == len(exp_boxes)
+    # outputs (possibly bound buffers) are left untouched
+    assert np.array_equal(outputs[1], boxes)
+
+
+def test_postprocess_empty(engine):
+    """Images without detections get empty results."""
+    outputs = [
+        np.zeros((2, 1), dtype=np.int32),
+        np.zeros((2, 100, 4), dtype=np.float32),
+        np.zeros((2, 100), dtype=np.float32),
+        np.zeros((2, 100), dtype=np.int32),
+    ]
+    results = engine.postprocess_end2end(
+        outputs, np.ones(2), np.zeros((2, 2)), np.full((2, 2), 640.0)
+    )
+
+    assert [len(result) for result in results] == [0, 0]
+    assert results[0].boxes.shape == (0, 4)
+    assert results[0].categories == []